@@ -12,13 +12,14 @@ for file_path in xlsx_files:
     print(f"{'='*80}")
     
     try:
-        # Load the Excel file
+        # Open the workbook once; every sheet below is parsed from this handle
         xls = pd.ExcelFile(file_path)
         print(f"Sheet Names: {xls.sheet_names}")
         
         for sheet_name in xls.sheet_names:
             print(f"\n  --- Sheet: {sheet_name} ---")
-            df = pd.read_excel(file_path, sheet_name=sheet_name, nrows=5)
+            # Only the first rows are needed, so stop the row stream after 5
+            df = xls.parse(sheet_name, nrows=5)
             print(f"  Columns: {df.columns.tolist()}")
             print(f"  First 3 rows:")
             print(df.head(3).to_string())
@@ -0,0 +1,37 @@
+// Decoder for the compact columnar JSON written by scripts/columnar_json.py (*.columnar.json).
+// {"$cols": {key: values[]}} becomes an array of records; {"$s": codes[]} indexes `strings`.
+
+export interface ColumnarDocument {
+    format: string;
+    strings: string[];
+    data: unknown;
+}
+
+export function decodeColumnar<T = unknown>(doc: ColumnarDocument): T {
+    const { strings } = doc;
+
+    const column = (col: any): unknown[] =>
+        Array.isArray(col) ? col.map(walk) : col.$s.map((c: number) => (c >= 0 ? strings[c] : null));
+
+    const walk = (node: any): unknown => {
+        if (Array.isArray(node)) return node.map(walk);
+        if (node === null || typeof node !== 'object') return node;
+        if ('$cols' in node) {
+            const keys = Object.keys(node.$cols);
+            const cols = keys.map((k) => column(node.$cols[k]));
+            const n = cols.length ? cols[0].length : 0;
+            const rows = new Array(n);
+            for (let i = 0; i < n; i++) {
+                const row: Record<string, unknown> = {};
+                keys.forEach((k, j) => { row[k] = cols[j][i]; });
+                rows[i] = row;
+            }
+            return rows;
+        }
+        const out: Record<string, unknown> = {};
+        for (const k of Object.keys(node)) out[k] = walk(node[k]);
+        return out;
+    };
+
+    return walk(doc.data) as T;
+}
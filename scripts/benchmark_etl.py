@@ -0,0 +1,178 @@
+"""
+Benchmarks for the ETL hot paths.
+Runs each stage on one real year of docs/tw-finance and on synthetic grids built by
+tiling the real table body 10x/100x, and emits JSON (seconds, rows/sec, peak allocation).
+With --compare, exits non-zero when a case got slower than the baseline by more than --threshold.
+
+    python scripts/benchmark_etl.py --year 114 --output bench.json
+    python scripts/benchmark_etl.py --compare bench.json
+"""
+
+import os
+import io
+import sys
+import json
+import argparse
+import contextlib
+import time
+import platform
+import tracemalloc
+import pandas as pd
+
+# Add script dir to import utils
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from workbook_loader import read_workbook, set_cache_enabled
+from transform_utils import HeaderIndex, clean_number, clean_number_array, find_header_row
+import budget_parser
+import etl_budget
+
+BASE_DIR = "docs/tw-finance"
+HEADER_KEYWORDS = budget_parser.HEADER_KEYWORDS
+
+def peak_alloc_kb(fn):
+    """
+    Peak memory allocated while fn() runs, above what was allocated before it (numpy and pandas
+    buffers included). Measured on its own extra run: ru_maxrss is a high-water mark for the
+    whole process, so it would repeat the largest case for every case after it, and tracing
+    slows the timed runs down.
+    """
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        with contextlib.redirect_stdout(io.StringIO()):
+            fn()
+        return (tracemalloc.get_traced_memory()[1] - base) // 1024
+    finally:
+        tracemalloc.stop()
+
+def time_case(name, fn, rows, repeat):
+    """Best-of-`repeat` wall time of fn(); best-of filters out scheduler noise."""
+    timings = []
+    for _ in range(repeat):
+        # Silence the per-file progress prints of the processors so they do not drown the table
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+    seconds = min(timings)
+    result = {
+        "name": name,
+        "rows": rows,
+        "seconds": round(seconds, 6),
+        "rows_per_sec": round(rows / seconds, 1) if seconds > 0 else None,
+        "peak_alloc_kb": peak_alloc_kb(fn),
+    }
+    print(f"  {name:<45} {rows:>9} rows  {seconds * 1000:>10.2f} ms  {result['rows_per_sec'] or 0:>14,.0f} rows/s"
+          f"  {result['peak_alloc_kb']:>9,} KB peak")
+    return result
+
+def synthetic_grid(df, header_row_idx, scale):
+    """Real header rows followed by the table body repeated `scale` times."""
+    head = df.iloc[:header_row_idx + 1]
+    body = df.iloc[header_row_idx + 1:]
+    return pd.concat([head] + [body] * scale, ignore_index=True)
+
+def bench_table(label, spec, budget_type, year, scales, repeat):
+    year_dir = os.path.join(BASE_DIR, str(year))
+    path = budget_parser.find_budget_file(year_dir, spec)
+    if path is None:
+        print(f"  No {spec['label']} file in {year_dir}, skipping.")
+        return []
+
+    results = []
+    df = read_workbook(path)
+    results.append(time_case(f"{label}.find_header_row", lambda: find_header_row(df, HEADER_KEYWORDS), min(len(df), 20), repeat))
+    header_row_idx = find_header_row(df, HEADER_KEYWORDS)
+    cols = budget_parser.detect_columns(df, header_row_idx)
+    results.append(time_case(f"{label}.header_index", lambda: HeaderIndex(df), min(len(df), 20), repeat))
+    df_head = df.head(15)
+    results.append(time_case(f"{label}.find_column_index", lambda: etl_budget.find_column_index(df_head, ['本年度預算數', '預算案數']), len(df_head), repeat))
+
+    amounts = df.iloc[header_row_idx + 1:, cols["amt"]]
+    results.append(time_case(f"{label}.clean_number[scalar]", lambda: [clean_number(v) for v in amounts], len(amounts), repeat))
+    results.append(time_case(f"{label}.clean_number_array", lambda: clean_number_array(amounts), len(amounts), repeat))
+
+    for scale in scales:
+        grid = synthetic_grid(df, header_row_idx, scale)
+        rows = len(grid) - header_row_idx - 1
+        results.append(time_case(f"{label}.parse_budget_table[x{scale}]",
+                                 lambda: budget_parser.parse_budget_table(grid, header_row_idx + 1, cols), rows, repeat))
+        results.append(time_case(f"{label}.etl_process_generic[x{scale}]",
+                                 lambda: etl_budget.process_generic(path, year, budget_type, etl_budget.BUDGET_KEYS, grid), rows, repeat))
+    return results
+
+def bench_end_to_end(year, repeat):
+    """Per-year processing including workbook parse (cache disabled)."""
+    set_cache_enabled(False)
+    results = []
+    for label, spec in [("revenue", budget_parser.REVENUE_SPEC),
+                        ("function", budget_parser.FUNCTION_SPEC),
+                        ("agency", budget_parser.AGENCY_SPEC)]:
+        with contextlib.redirect_stdout(io.StringIO()):
+            res = budget_parser.process_year(year, spec, BASE_DIR)
+        rows = sum(len(res[level]) for level in ["Kuan", "Xiang", "Mu", "Jie"]) if res else 0
+        results.append(time_case(f"end_to_end.{label}.process_year", lambda: budget_parser.process_year(year, spec, BASE_DIR), rows, repeat))
+    with contextlib.redirect_stdout(io.StringIO()):
+        budget, funds, summary, _ = etl_budget.process_year_dir(year)
+    results.append(time_case("end_to_end.etl_budget.process_year_dir", lambda: etl_budget.process_year_dir(year),
+                             len(budget) + len(funds) + len(summary), repeat))
+    set_cache_enabled(True)
+    return results
+
+def compare(results, baseline_path, threshold):
+    """Cases that are more than `threshold` (fraction) slower than the baseline run."""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {case["name"]: case for case in json.load(f)["results"]}
+    regressions = []
+    for case in results:
+        base = baseline.get(case["name"])
+        if base and base["seconds"] > 0 and case["seconds"] > base["seconds"] * (1 + threshold):
+            regressions.append({"name": case["name"], "baseline_seconds": base["seconds"], "seconds": case["seconds"]})
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ETL hot paths")
+    parser.add_argument("--year", type=int, default=114, help="ROC year of docs/tw-finance to benchmark (default: 114)")
+    parser.add_argument("--scales", default="1,10,100", help="Synthetic row multipliers (default: 1,10,100)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case; the best time is reported")
+    parser.add_argument("--skip-end-to-end", action="store_true", help="Skip the per-year runs that re-parse Excel")
+    parser.add_argument("--output", help="Write the JSON results to this file instead of stdout")
+    parser.add_argument("--compare", help="Baseline JSON from an earlier --output run")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown vs baseline (default: 0.25 = 25%%)")
+    args = parser.parse_args()
+
+    scales = [int(s) for s in args.scales.split(",")]
+
+    results = []
+    print(f"Benchmarking year {args.year} (scales {scales}, best of {args.repeat})")
+    # budget_type is what etl_budget.py passes process_generic for the same workbook
+    for label, spec, budget_type in [("revenue", budget_parser.REVENUE_SPEC, "Revenue"),
+                                     ("agency", budget_parser.AGENCY_SPEC, "Expenditure")]:
+        results.extend(bench_table(label, spec, budget_type, args.year, scales, args.repeat))
+    if not args.skip_end_to_end:
+        results.extend(bench_end_to_end(args.year, args.repeat))
+
+    report = {
+        "year": args.year,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "results": results,
+    }
+    if args.compare:
+        report["regressions"] = compare(results, args.compare, args.threshold)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Wrote {args.output}")
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    if report.get("regressions"):
+        for r in report["regressions"]:
+            print(f"REGRESSION {r['name']}: {r['baseline_seconds']:.4f}s -> {r['seconds']:.4f}s")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,429 @@
+"""
+Parser engine for the hierarchical 款/項/目/節 budget tables
+(歲入來源別, 歲出政事別, 歲出機關別). A spec dict describes which workbook to pick
+and which header keywords to look for; process_year does the rest, so every table
+shares one header detection, column fallback and row walk.
+"""
+import os
+import re
+import json
+import traceback
+import numpy as np
+import pandas as pd
+
+from workbook_loader import probe_workbook, read_workbook, set_cache_enabled
+from record_store import RecordStore, StringTable, STR, INT, encode_records
+from columnar_json import write_compact
+from name_registry import NameRegistry, REGISTRY_FILE
+from timing import session, span, timed
+from transform_utils import (HeaderIndex, get_ad_year, clean_str, clean_number_array, clean_str_column, find_header_row,
+                             build_arg_parser, iter_years, run_years)
+
+CODE_NAME_RE = re.compile(r"^(\d+)\.?(.*)$")
+COMBINED_ID_NAME_RE = re.compile(r"^(\d+)\s*(.+)$")
+CODE_WIDTHS = {"k": 2, "x": 2, "m": 2, "j": 4}
+# One node of a level list; parent_id is None on Kuan rows
+LEVEL_FIELDS = {"id": STR, "name": STR, "amount": INT, "parent_id": STR}
+LEVELS = ["Kuan", "Xiang", "Mu", "Jie"]
+
+HEADER_KEYWORDS = ["款", "項", "目", "節", "預算", "名稱", "本年度", "科目"]
+TOTAL_NAMES = ["合計", "總計"]
+# 節 code of the 政事別 group rows of the 97-103 agency sheets (see parse_budget_table)
+GROUP_CODE = "999"
+
+def _budget_file(f, *required):
+    return all(k in f for k in required) and "分析" not in f and not f.startswith("~")
+
+REVENUE_SPEC = {
+    "label": "revenue",
+    # Keyword match from spec: "歲入來源別" OR ("來源" AND "科目")
+    "file_match": lambda f: (_budget_file(f, "歲入", "來源", "預算") or _budget_file(f, "來源", "科目", "預算")),
+    "header_keywords": HEADER_KEYWORDS,
+}
+
+FUNCTION_SPEC = {
+    "label": "expenditure function",
+    "file_match": lambda f: _budget_file(f, "歲出", "政事"),
+    "header_keywords": HEADER_KEYWORDS,
+}
+
+AGENCY_SPEC = {
+    "label": "expenditure agency",
+    "file_match": lambda f: _budget_file(f, "歲出", "機關別"),
+    # Year 99 ships this table under a numeric file name
+    "content_match": lambda head: "總統府主管" in head and "節" in head and "本年度預算數" in head,
+    "header_keywords": HEADER_KEYWORDS,
+}
+
+@timed("discover")
+def find_budget_file(year_dir, spec):
+    """Pick the workbook by file name, falling back to a header probe of numerically named files."""
+    for f in os.listdir(year_dir):
+        if spec["file_match"](f):
+            return os.path.join(year_dir, f)
+
+    content_match = spec.get("content_match")
+    if content_match is None:
+        return None
+    for f in os.listdir(year_dir):
+        stem, ext = os.path.splitext(f)
+        if stem.isdigit() and ext in (".xls", ".xlsx"):
+            path = os.path.join(year_dir, f)
+            if content_match(HeaderIndex(probe_workbook(path)).text):
+                return path
+    return None
+
+def detect_columns(df, header_row_idx):
+    """
+    Column indices of the level/name/amount columns from the header row, -1 when absent.
+    Layouts differ by year, so missing level columns fall back to the usual 0-3 positions,
+    the name to column 4 and the amount to the row above the header or the column after the name.
+    """
+    header_vals = df.iloc[header_row_idx].values
+    cols = {"k": -1, "x": -1, "m": -1, "j": -1, "name": -1, "amt": -1}
+    levels = {"款": "k", "項": "x", "目": "m", "節": "j"}
+
+    for idx, val in enumerate(header_vals):
+        v = clean_str(val)
+        if v in levels: cols[levels[v]] = idx
+        elif "名稱" in v or "科目" in v: cols["name"] = idx
+        elif ("預算" in v or "本年度" in v) and cols["amt"] == -1: cols["amt"] = idx
+
+    if cols["k"] == -1: cols["k"] = 0
+    if cols["x"] == -1: cols["x"] = 1
+    if cols["m"] == -1: cols["m"] = 2
+    if cols["j"] == -1 and len(header_vals) > 3: cols["j"] = 3
+    if cols["name"] == -1 and len(header_vals) > 4: cols["name"] = 4
+
+    if cols["amt"] == -1 and header_row_idx > 0:
+        for idx, val in enumerate(df.iloc[header_row_idx - 1].values):
+            v = clean_str(val)
+            if "本年度" in v or "預算" in v:
+                cols["amt"] = idx
+                break
+
+    if cols["amt"] == -1 and cols["name"] != -1 and cols["name"] + 1 < len(header_vals):
+        cols["amt"] = cols["name"] + 1
+    return cols
+
+
+def pad_code_column(codes, width):
+    """Vectorized pad_code: digit codes are zero-filled, anything else is padded/truncated to width."""
+    return codes.str.zfill(width).where(codes.str.isdigit(), codes.str.ljust(width, '0').str[:width])
+
+@timed("extract")
+def parse_budget_table(df, start_row, cols):
+    """
+    Columnar Kuan/Xiang/Mu/Jie extraction (the single hot path for every 款/項/目/節 table).
+    cols: {'k', 'x', 'm', 'j', 'name', 'amt'} -> column index (-1 if absent).
+    Each level column holds "code.name" text; the deepest non-empty level column decides the
+    row level. Returns {"Kuan", "Xiang", "Mu", "Jie"} -> RecordStore of LEVEL_FIELDS, each item
+    {id, name, amount, parent_id} with the 2-2-2-4 id built from the current codes, plus
+    "sheet_total": the amount of the sheet's own uncoded 合計/總計 row (None if it has none).
+    """
+    body = df.iloc[start_row:]
+
+    def column(key):
+        idx = cols.get(key, -1)
+        if idx == -1 or idx >= df.shape[1]:
+            return pd.Series("", index=body.index, dtype=object)
+        return clean_str_column(body[df.columns[idx]])
+
+    levels = ["k", "x", "m", "j"]
+    raw = {lvl: column(lvl) for lvl in levels}
+    present = {lvl: raw[lvl] != "" for lvl in levels}
+    code = {}
+    name_part = {}
+    for lvl in levels:
+        parts = raw[lvl].str.extract(CODE_NAME_RE)
+        matched = parts[0].notna()
+        code[lvl] = parts[0].where(matched, raw[lvl])
+        name_part[lvl] = parts[1].str.strip().where(matched, raw[lvl])
+
+    # Deepest level present wins, since parent columns may be repeated on child rows
+    level_num = pd.Series(np.select([present["j"], present["m"], present["x"], present["k"]], [3, 2, 1, 0], default=-1), index=body.index)
+
+    # Current code per level: set where the level column is filled, reset to "0" when a
+    # shallower row starts a new branch, otherwise carried forward
+    full_id = pd.Series("", index=body.index, dtype=object)
+    for depth, lvl in enumerate(levels):
+        state = pd.Series(None, index=body.index, dtype=object)
+        state[(level_num >= 0) & (level_num < depth)] = "0"
+        state[present[lvl]] = code[lvl][present[lvl]]
+        state = state.ffill().fillna("0")
+        full_id = full_id + pad_code_column(state, CODE_WIDTHS[lvl])
+
+    explicit = column("name")
+    combined = explicit.str.extract(COMBINED_ID_NAME_RE)
+    final_name = combined[1].str.strip().where(combined[1].notna(), explicit)
+    level_name = pd.Series(np.select([level_num == d for d in range(4)], [name_part[lvl] for lvl in levels], default=""), index=body.index)
+    final_name = final_name.where(final_name != "", level_name)
+
+    amt_idx = cols.get("amt", -1)
+    if amt_idx != -1 and amt_idx < df.shape[1]:
+        amount_values, unparseable = clean_number_array(body[df.columns[amt_idx]])
+        amount = pd.Series(amount_values, index=body.index)
+        if unparseable.any():
+            print(f"  Warning: {unparseable.sum()} unparseable amount cells counted as 0")
+    else:
+        amount = pd.Series(0, index=body.index, dtype='int64')
+
+    # The grand total row has no level code; matched on the whole name, since item names
+    # such as 綜合計畫 contain 合計. A coded 合計 row is a subtotal, so it never counts, and
+    # of several uncoded ones the last (the trailing total) wins
+    total_rows = final_name.isin(TOTAL_NAMES) & (level_num == -1)
+    sheet_total = int(amount[total_rows].iloc[-1]) if total_rows.any() else None
+    if total_rows.sum() > 1 and amount[total_rows].nunique() > 1:
+        print(f"  Warning: {total_rows.sum()} uncoded 合計/總計 rows disagree; using the last ({sheet_total})")
+
+    # The 97-103 agency sheets put a 政事別 group row (節 code 999, no 目: 國務支出, 科學支出, ...)
+    # above each function's 目 rows; it is their subtotal, not a node, and read as a 節 it would
+    # be summed into the 目 before it
+    group_rows = (code["j"] == GROUP_CODE) & ~present["m"]
+    emit = (level_num >= 0) & ~((amount == 0) & (final_name == "")) & ~group_rows
+    # Sheet "合計"/"總計" Kuan rows are dropped so the year total is not double counted
+    is_total = (level_num == 0) & final_name.str.contains("合計|總計")
+    emit &= ~is_total
+
+    # Parent of a row is the most recently emitted node one level up
+    parent_id = pd.Series(None, index=body.index, dtype=object)
+    for depth in range(1, 4):
+        last_id = full_id.where(emit & (level_num == depth - 1)).ffill()
+        at_depth = level_num == depth
+        parent_id[at_depth] = last_id[at_depth]
+
+    # One string table for all four levels, since child rows repeat their parents' names
+    strings = StringTable()
+    result = {}
+    for depth, key in enumerate(LEVELS):
+        rows = emit & (level_num == depth)
+        result[key] = RecordStore(LEVEL_FIELDS, strings)
+        result[key].extend_frame(pd.DataFrame({
+            "id": full_id[rows], "name": final_name[rows], "amount": amount[rows], "parent_id": parent_id[rows]}))
+    result["sheet_total"] = sheet_total
+    return result
+
+def process_year(year, spec, base_dir):
+    """
+    Parse one year's table described by spec.
+    Returns {year, amount, Kuan, Xiang, Mu, Jie} or None when the file is missing or unreadable.
+    """
+    year_dir = os.path.join(base_dir, str(year))
+    if not os.path.exists(year_dir):
+        return None
+
+    target_file = find_budget_file(year_dir, spec)
+    if not target_file:
+        print(f"[{year}] No {spec['label']} file found.")
+        return None
+
+    print(f"[{year}] Processing {os.path.basename(target_file)}...")
+
+    try:
+        df = read_workbook(target_file)
+
+        header_row_idx = find_header_row(df, spec["header_keywords"])
+        if header_row_idx is None:
+             print(f"  Warning: No header found for year {year}")
+             return None
+
+        cols = detect_columns(df, header_row_idx)
+
+        start_row = header_row_idx + 1
+        # Skip unit row if present
+        if start_row < len(df) and "單位" in clean_str(df.iloc[start_row][0]):
+            start_row += 1
+
+        levels = parse_budget_table(df, start_row, cols)
+
+        # Sheet totals are dropped by the walk, so the year total is the sum of the Kuan;
+        # the sheet's own total is kept to check it against (see validate_totals.py)
+        amount = int(levels["Kuan"].column("amount").sum())
+        if levels["sheet_total"] is not None and levels["sheet_total"] != amount:
+            print(f"  Warning: {spec['label']} total {amount} does not match the sheet's 合計 {levels['sheet_total']}")
+        return {
+            "year": get_ad_year(year),
+            "amount": amount,
+            "sheet_total": levels["sheet_total"],
+            "Kuan": levels["Kuan"],
+            "Xiang": levels["Xiang"],
+            "Mu": levels["Mu"],
+            "Jie": levels["Jie"]
+        }
+
+    except Exception as e:
+        print(f"  Error processing {year}: {e}")
+        traceback.print_exc()
+        return None
+
+def assign_name_ids(res, registry):
+    """Add a name_id field (the NameRegistry id of the node name) to every level of a process_year result."""
+    for level in LEVELS:
+        store = res[level]
+        if "name_id" not in store.fields:
+            store.add_column("name_id", INT, registry.ids(store.column("name"), res["year"]))
+    return res
+
+@timed("tree")
+def build_tree(res):
+    """
+    Adjacency index of one process_year result, as parallel arrays over its nodes.
+    Nodes are ordered level by level, and within a level by parent position then id, so the
+    children of node i are exactly nodes child_start[i]:child_end[i] and drill-down is a slice.
+    parent is the parent's node index (-1 for Kuan and for rows whose parent_id is missing);
+    subtree_sum is the sum of the leaf amounts below a node (its own amount for a leaf).
+    name_id is included when the levels carry one (assign_name_ids).
+    """
+    ids, names, name_ids, amounts, depths, parents = [], [], [], [], [], []
+    child_start = []
+    child_count = []
+    offset = 0
+    prev_ids = None
+    for depth, level in enumerate(LEVELS):
+        store = res[level]
+        level_ids = store.column("id")
+        if prev_ids is None:
+            parent = np.full(len(level_ids), -1, dtype=np.int64)
+        else:
+            # Positions into the previous level (ids are unique within a level), then global indexes
+            local = pd.Index(prev_ids).get_indexer(store.column("parent_id"))
+            parent = np.where(local >= 0, local + prev_offset, -1)
+            # Children counts of the previous level, in its order; orphans (-1) are sorted first
+            counts = np.bincount(local[local >= 0], minlength=len(prev_ids))
+            first = offset + int((local < 0).sum())
+            child_start.append(first + np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64))
+            child_count.append(counts)
+        order = np.lexsort((level_ids, parent))
+        ids.append(level_ids[order])
+        names.append(store.column("name")[order])
+        if "name_id" in store.fields:
+            name_ids.append(store.column("name_id")[order])
+        amounts.append(store.column("amount")[order])
+        parents.append(parent[order])
+        depths.append(np.full(len(order), depth, dtype=np.int64))
+        prev_ids, prev_offset = ids[-1], offset
+        offset += len(order)
+    # The deepest level has no children
+    child_start.append(np.full(len(prev_ids), offset, dtype=np.int64))
+    child_count.append(np.zeros(len(prev_ids), dtype=np.int64))
+
+    amount = np.concatenate(amounts)
+    parent = np.concatenate(parents)
+    depth = np.concatenate(depths)
+    start = np.concatenate(child_start)
+    end = start + np.concatenate(child_count)
+
+    # Bottom-up: leaves contribute their amount, each level then adds into its parents
+    subtree = np.where(end > start, 0, amount)
+    for d in range(len(LEVELS) - 1, 0, -1):
+        rows = (depth == d) & (parent >= 0)
+        np.add.at(subtree, parent[rows], subtree[rows])
+
+    tree = {
+        "year": res["year"],
+        "levels": LEVELS,
+        "roots": np.flatnonzero(parent < 0).tolist(),
+        "id": np.concatenate(ids).tolist(),
+        "name": np.concatenate(names).tolist(),
+        "amount": amount.tolist(),
+        "depth": depth.tolist(),
+        "parent": parent.tolist(),
+        "child_start": start.tolist(),
+        "child_end": end.tolist(),
+        "subtree_sum": subtree.tolist(),
+    }
+    if len(name_ids) == len(LEVELS):
+        tree["name_id"] = np.concatenate(name_ids).tolist()
+    return tree
+
+def write_tree(tree, path):
+    """Compact JSON; a tree is already parallel arrays, so indentation would only add size."""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(tree, f, ensure_ascii=False, separators=(",", ":"))
+
+def write_shards(results, shard_dir):
+    """
+    Write process_year results as one compact JSON array per year and level
+    (<shard_dir>/<year>/<Level>.json), the year's build_tree (<year>/tree.json), and
+    <shard_dir>/index.json listing each year's total and its shards, so a client only
+    fetches the levels it renders.
+    Years are written as they arrive, so results can be a generator. Returns the index.
+    """
+    index = {"levels": LEVELS, "years": []}
+    for res in results:
+        # Inside the loop: results may be a generator still extracting the next year
+        with span("serialize"):
+            year_dir = os.path.join(shard_dir, str(res["year"]))
+            os.makedirs(year_dir, exist_ok=True)
+            shards = {}
+            for level in LEVELS:
+                path = os.path.join(year_dir, f"{level}.json")
+                with open(path, 'w', encoding='utf-8') as f:
+                    json.dump(res[level].to_records(), f, ensure_ascii=False, separators=(",", ":"))
+                # Paths are relative to index.json so the directory can be served from anywhere
+                shards[level] = {"path": f"{res['year']}/{level}.json", "count": len(res[level]),
+                                 "bytes": os.path.getsize(path)}
+            tree_path = os.path.join(year_dir, "tree.json")
+            write_tree(build_tree(res), tree_path)
+            index["years"].append({"year": res["year"], "amount": res["amount"], "shards": shards,
+                                   "tree": {"path": f"{res['year']}/tree.json", "bytes": os.path.getsize(tree_path)}})
+
+    os.makedirs(shard_dir, exist_ok=True)
+    with open(os.path.join(shard_dir, "index.json"), 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+    return index
+
+def table_main(process_year, target_years, base_dir, output_file):
+    """
+    Command line of a level transform (transform_revenue.py, ...): output_file, or with
+    --sharded per-year shards in the directory of the same name, plus the optional
+    --compact / --tree copies next to it. process_year is the script's own top-level
+    function, so the worker processes can import it.
+    """
+    stem = os.path.splitext(output_file)[0]
+    shard_dir, tree_file = stem, stem + "_tree.json"
+    parser = build_arg_parser(f"Build {output_file}")
+    parser.add_argument("--sharded", action="store_true",
+                        help=f"Write per-year, per-level shards and an index.json under {shard_dir}/ instead of one file")
+    parser.add_argument("--compact", action="store_true",
+                        help="Also write a minified columnar copy (<name>.columnar.json, see columnar_json.py) and report sizes")
+    parser.add_argument("--tree", action="store_true",
+                        help=f"Also write {tree_file}: per-year parent/child offset ranges and subtree sums")
+    args = parser.parse_args()
+    # Both are copies of the single output file, which --sharded does not write (each shard
+    # year already has its own tree.json)
+    if args.sharded and (args.compact or args.tree):
+        parser.error("--compact and --tree cannot be combined with --sharded")
+    with session(args):
+        run_table(args, process_year, target_years, base_dir, output_file, shard_dir, tree_file)
+
+def run_table(args, process_year, target_years, base_dir, output_file, shard_dir, tree_file):
+    set_cache_enabled(not args.no_cache)
+    # Ids are looked up here, not in the workers, so the registry is loaded once
+    registry = NameRegistry.load(REGISTRY_FILE)
+
+    if args.sharded:
+        results = (assign_name_ids(res, registry)
+                   for res in iter_years(process_year, target_years, args, base_dir) if res)
+        index = write_shards(results, shard_dir)
+        registry.warn_missing()
+        print(f"Generated {shard_dir}/index.json with {len(index['years'])} years of shards.")
+        return
+
+    final_output = [assign_name_ids(res, registry)
+                    for res in run_years(process_year, target_years, args, base_dir) if res]
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    with span("serialize"), open(output_file, 'w', encoding='utf-8') as f:
+        # Level lists are RecordStores until here; encode_records writes them out as lists of dicts
+        json.dump(final_output, f, ensure_ascii=False, indent=2, default=encode_records)
+
+    print(f"Generated {output_file} with {len(final_output)} year records.")
+    registry.warn_missing()
+    if args.compact:
+        with span("serialize"):
+            write_compact(final_output, output_file)
+    if args.tree:
+        trees = [build_tree(res) for res in final_output]
+        with span("serialize"):
+            write_tree(trees, tree_file)
+        print(f"Generated {tree_file}")
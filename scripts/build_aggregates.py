@@ -0,0 +1,199 @@
+"""
+Precomputed aggregate cube (table × year × level × node) over the transform outputs,
+so the dashboard reads YoY and CAGR figures instead of recomputing them on every page load.
+
+Inputs (whichever exist): data/json/summary.json and the level tables
+data/json/{revenue_by_source,expenditure_by_function,expenditure_by_agency}.json.
+Outputs: aggregate_cube.csv in --unified-dir and aggregate_cube.json in --json-dir (by default
+data/unified and data/json), one row per node-year:
+    table, year, level, id, name, name_id, parent_id, amount,
+    share      amount / the table's total of that year
+    yoy_delta  amount - the same node's amount the year before
+    yoy_pct    yoy_delta / last year's amount
+    cagr       (amount / amount N years earlier) ** (1/N) - 1, N = --cagr-years
+Ratios are fractions (0.05 = 5%) and null where the base year is missing or not positive.
+A node's series follows the name_id path from its Kuan down (see name_registry.py), so it
+continues across years where the budget ids were renumbered or the name was respelled.
+Same-named siblings with different ids stay separate series (numbered by id), with a warning.
+"""
+
+import os
+import sys
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from name_registry import NameRegistry, REGISTRY_FILE, canonical_name
+
+JSON_DIR = "data/json"
+UNIFIED_DIR = "data/unified"
+OUTPUT_CSV = "aggregate_cube.csv"    # written to --unified-dir
+OUTPUT_JSON = "aggregate_cube.json"  # written to --json-dir, next to the inputs
+LEVEL_TABLES = {
+    "revenue": "revenue_by_source.json",
+    "function": "expenditure_by_function.json",
+    "agency": "expenditure_by_agency.json",
+}
+LEVELS = ["Kuan", "Xiang", "Mu", "Jie"]
+TOTAL_LEVEL = "Total"
+CAGR_YEARS = 4  # one administration term
+CUBE_COLUMNS = ["table", "year", "level", "id", "name", "name_id", "parent_id", "amount",
+                "share", "yoy_delta", "yoy_pct", "cagr"]
+NODE_COLUMNS = ["table", "year", "level", "id", "name", "parent_id", "amount"]
+# Budget ids are numbered per year, so the same id can name a different item in another year;
+# series are keyed on the integer node (table, level, name_id path) instead
+NODE_KEYS = ["table", "level", "node"]
+
+
+def load_json(path):
+    if not os.path.exists(path):
+        print(f"Skipping {path} (not found)")
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def summary_frame(years):
+    """Summary totals and categories as two tables: summary_revenue and summary_expenditure."""
+    rows = []
+    for year_data in years:
+        for kind in ["revenue", "expenditure"]:
+            table = f"summary_{kind}"
+            rows.append((table, year_data["year"], TOTAL_LEVEL, "total", kind, None, year_data[kind]))
+            for cat in year_data[f"{kind}_categories"]:
+                rows.append((table, year_data["year"], "Category", cat["name"], cat["name"], "total", cat["amount"]))
+    return pd.DataFrame(rows, columns=NODE_COLUMNS)
+
+def level_frame(table, years):
+    """One level table flattened to rows, plus a Total row per year (the sum of its Kuan)."""
+    frames = []
+    for year_data in years:
+        for level in LEVELS:
+            nodes = year_data.get(level, [])
+            if nodes:
+                frames.append(pd.DataFrame(nodes).assign(table=table, year=year_data["year"], level=level))
+    if not frames:
+        return None
+    df = pd.concat(frames, ignore_index=True)
+    totals = (df[df["level"] == "Kuan"].groupby("year", as_index=False)["amount"].sum()
+              .assign(table=table, level=TOTAL_LEVEL, id="total", name=table, parent_id=None))
+    return pd.concat([totals, df], ignore_index=True)[NODE_COLUMNS + (['name_id'] if 'name_id' in df else [])]
+
+def split_siblings(df, path, rows):
+    """
+    Keep distinct nodes apart that share a path in one year (same-named siblings, e.g. two
+    非營業特種基金 Mu under one Xiang): the k-th of them by id gets "#k" appended to its path,
+    so it is not summed into the first. Returns the number of such groups.
+    """
+    sub = df.loc[rows, ["table", "year", "id"]].assign(path=path[rows].to_numpy())
+    distinct = sub.drop_duplicates().sort_values("id", kind="stable")
+    distinct["ordinal"] = distinct.groupby(["table", "year", "path"], sort=False).cumcount()
+    ordinal = sub.merge(distinct, on=["table", "year", "id", "path"], how="left")["ordinal"].to_numpy()
+    own = path[rows].to_numpy()
+    path[rows] = np.where(ordinal > 0, own + "#" + ordinal.astype(str), own)
+    return int((distinct["ordinal"] == 1).sum())
+
+def node_keys(df, registry):
+    """
+    Fill name_id where the input has none and add the integer node key: the name_id path of a row
+    from its Kuan down, factorized with table and level. Rows whose parent is missing start a path;
+    names the registry lacks (name_id -1) use their canonical name in the path instead. Rows that
+    repeat one id (split rows) share a key and are summed by build_cube; same-named siblings with
+    different ids do not (see split_siblings).
+    """
+    if "name_id" not in df:
+        df["name_id"] = np.nan
+    missing = df["name_id"].isna() & (df["level"] != TOTAL_LEVEL)
+    df.loc[missing, "name_id"] = registry.ids(df.loc[missing, "name"].to_numpy())
+    df["name_id"] = df["name_id"].fillna(-1).astype(np.int64)
+    registry.warn_missing()
+
+    known = df["name_id"] >= 0
+    path = df["name_id"].astype(str).where(known, "~" + df["name"].map(canonical_name))
+    collisions = split_siblings(df, path, df["level"] == LEVELS[0])
+    for parent_level, level in zip(LEVELS, LEVELS[1:]):
+        parents = df.loc[df["level"] == parent_level, ["table", "year", "id"]].assign(parent_path=path)
+        parents = parents.drop_duplicates(["table", "year", "id"]).rename(columns={"id": "parent_id"})
+        rows = df["level"] == level
+        parent_path = df.loc[rows, ["table", "year", "parent_id"]].merge(
+            parents, on=["table", "year", "parent_id"], how="left")["parent_path"].to_numpy()
+        own = path[rows].to_numpy()
+        path[rows] = np.where(pd.isna(parent_path), own, parent_path.astype(str) + "/" + own)
+        collisions += split_siblings(df, path, rows)
+    if collisions:
+        print(f"Warning: {collisions} groups of same-named siblings with different ids; kept as separate nodes (path#k).")
+    df["node"] = pd.factorize(df["table"] + "|" + df["level"] + "|" + path)[0]
+    return df
+
+def _ratio(num, den):
+    """num / den, NaN where den is missing or not positive."""
+    den = den.where(den > 0)
+    return num / den
+
+def build_cube(df, cagr_years=CAGR_YEARS):
+    """Add share / YoY / CAGR columns to node-year rows with one merge per lookback."""
+    # A few tables repeat a node within one year (split rows); fold them so every lookup is 1:1
+    df = (df.groupby(NODE_KEYS + ["year"], sort=False, dropna=False)
+            .agg(id=("id", "first"), name=("name", "first"), name_id=("name_id", "first"),
+                 parent_id=("parent_id", "first"), amount=("amount", "sum")).reset_index())
+
+    totals = df[df["level"] == TOTAL_LEVEL].set_index(["table", "year"])["amount"]
+    year_total = pd.Series(totals.reindex(pd.MultiIndex.from_frame(df[["table", "year"]])).values, index=df.index)
+    df["share"] = _ratio(df["amount"], year_total)
+
+    def lookback(years):
+        past = df[NODE_KEYS + ["year", "amount"]].assign(year=df["year"] + years)
+        return df[NODE_KEYS + ["year"]].merge(past, on=NODE_KEYS + ["year"], how="left")["amount"]
+
+    prev = lookback(1)
+    df["yoy_delta"] = df["amount"] - prev
+    df["yoy_pct"] = _ratio(df["yoy_delta"], prev)
+
+    base = lookback(cagr_years)
+    growth = _ratio(df["amount"], base)
+    df["cagr"] = np.power(growth.where(growth > 0), 1.0 / cagr_years) - 1
+
+    df["yoy_delta"] = df["yoy_delta"].astype("Int64")
+    df[["share", "yoy_pct", "cagr"]] = df[["share", "yoy_pct", "cagr"]].round(6)
+    return df.sort_values(["table", "year", "id"], kind="stable")[CUBE_COLUMNS].reset_index(drop=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the year-over-year / CAGR aggregate cube")
+    parser.add_argument("--json-dir", default=JSON_DIR, help=f"Transform outputs directory (default: {JSON_DIR})")
+    parser.add_argument("--unified-dir", default=UNIFIED_DIR, help=f"CSV output directory (default: {UNIFIED_DIR})")
+    parser.add_argument("--cagr-years", type=int, default=CAGR_YEARS,
+                        help=f"CAGR lookback in years (default: {CAGR_YEARS})")
+    parser.add_argument("--registry", default=REGISTRY_FILE, help=f"Name registry (default: {REGISTRY_FILE})")
+    args = parser.parse_args()
+
+    frames = []
+    summary = load_json(os.path.join(args.json_dir, "summary.json"))
+    if summary:
+        frames.append(summary_frame(summary))
+    for table, filename in LEVEL_TABLES.items():
+        years = load_json(os.path.join(args.json_dir, filename))
+        if years:
+            frames.append(level_frame(table, years))
+    frames = [f for f in frames if f is not None]
+    if not frames:
+        print("No transform outputs found; run the transform_*.py scripts first.")
+        return
+
+    # Read-only: names the registry lacks are keyed on their canonical name (see node_keys)
+    registry = NameRegistry.load(args.registry)
+    cube = build_cube(node_keys(pd.concat(frames, ignore_index=True), registry), args.cagr_years)
+
+    csv_path = os.path.join(args.unified_dir, OUTPUT_CSV)
+    json_path = os.path.join(args.json_dir, OUTPUT_JSON)
+    os.makedirs(args.unified_dir, exist_ok=True)
+    os.makedirs(args.json_dir, exist_ok=True)
+    cube.to_csv(csv_path, index=False)
+    with open(json_path, 'w', encoding='utf-8') as f:
+        # to_json writes NaN/<NA> as null
+        f.write(cube.to_json(orient="records", force_ascii=False))
+    print(f"Generated {csv_path} and {json_path} with {len(cube)} rows "
+          f"({cube['table'].nunique()} tables, {cube['year'].nunique()} years).")
+
+if __name__ == "__main__":
+    main()
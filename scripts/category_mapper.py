@@ -0,0 +1,73 @@
+"""
+Keyword -> value classification compiled once, for the transforms that map raw row names
+onto a fixed set of categories (summary categories, fund types, ...).
+
+All keywords go into one regex alternation (longest first within a rule set, so "營業盈餘"
+is tried before "營業"), scanned once per name; when several keywords occur, the rule
+listed first wins, as with the linear `for kw in MAP: if kw in name` scans this replaces.
+Results are memoized per name, and names repeat across years and sheets, so most lookups
+are a dict hit.
+
+    mapper = load_category_map()                 # docs/specs/v2.0.0/category_map.json
+    mapper.match("  稅課收入  ")                    # -> {"id": "REV_TAX", "type": "revenue", "name": "稅課收入", ...}
+"""
+
+import os
+import re
+import json
+
+CATEGORY_MAP_FILE = os.path.join("docs", "specs", "v2.0.0", "category_map.json")
+
+
+class KeywordMapper:
+    """Substring rules (keyword, value) in priority order, compiled into one regex."""
+
+    def __init__(self, rules, default=None):
+        self.default = default
+        # keyword -> (priority, value); a keyword listed twice keeps its first rule
+        self._rules = {}
+        for priority, (keyword, value) in enumerate(rules):
+            self._rules.setdefault(keyword, (priority, value))
+        keywords = sorted(self._rules, key=len, reverse=True)
+        # Zero-width lookahead, so overlapping keywords at every position are all seen
+        self._pattern = re.compile("(?=(" + "|".join(map(re.escape, keywords)) + "))") if keywords else None
+        self._cache = {}
+
+    def __len__(self):
+        return len(self._rules)
+
+    def _scan(self, name):
+        best = None
+        for m in self._pattern.finditer(name):
+            # The alternation yields the longest keyword at this position; shorter ones
+            # starting here are prefixes of it and are checked too
+            hit = m.group(1)
+            for keyword in (hit[:n] for n in range(len(hit), 0, -1)):
+                rule = self._rules.get(keyword)
+                if rule is not None and (best is None or rule[0] < best[0]):
+                    best = rule
+        return self.default if best is None else best[1]
+
+    def match(self, name):
+        """The value of the highest-priority rule whose keyword occurs in name, else default."""
+        try:
+            return self._cache[name]
+        except KeyError:
+            value = self._scan(name) if self._pattern and name else self.default
+            self._cache[name] = value
+            return value
+
+
+def load_category_map(path=CATEGORY_MAP_FILE):
+    """
+    A KeywordMapper over the spec's categories: each entry's "match" keywords (and its "zh"
+    names) map to {"id", "type", "name", "en", "abbr"}, where "name" is the first "zh" name.
+    """
+    with open(path, encoding='utf-8') as f:
+        entries = json.load(f)
+    rules = []
+    for entry in entries:
+        value = {"id": entry["id"], "type": entry["type"], "name": entry["zh"][0],
+                 "en": entry["en"], "abbr": entry["abbr"]}
+        rules.extend((keyword, value) for keyword in entry.get("match", []) + entry["zh"])
+    return KeywordMapper(rules)
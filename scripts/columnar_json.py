@@ -0,0 +1,127 @@
+"""
+Compact, columnar JSON for the dashboard outputs.
+Every list of same-keyed records becomes {"$cols": {key: [values...]}} (parallel arrays,
+so each key is written once instead of once per record), and text columns become
+{"$s": [codes]} indexes into one "strings" dictionary shared by the whole document,
+so names repeated across years and levels are stored once. No indentation or spaces.
+
+    {"format": "columnar-1", "strings": [...], "data": <the original structure, encoded>}
+
+decode() (and fiscalinsight-taiwan/src/columnar.ts) turn it back into the original JSON.
+Run as a script to compact existing files and report their sizes:
+
+    python scripts/columnar_json.py fiscalinsight-taiwan/src/data/raw/budget_detail.json
+"""
+
+import os
+import sys
+import json
+import argparse
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from record_store import RecordStore, StringTable, STR
+
+FORMAT = "columnar-1"
+
+
+def _is_table(value):
+    """A non-empty list of dicts that all have the same (non-empty) keys in the same order."""
+    if not value or not isinstance(value, list) or not isinstance(value[0], dict) or not value[0]:
+        return False
+    keys = list(value[0])
+    return all(isinstance(v, dict) and list(v) == keys for v in value)
+
+def _text_column(values):
+    return any(isinstance(v, str) for v in values) and all(v is None or isinstance(v, str) for v in values)
+
+
+class _Encoder:
+    def __init__(self):
+        self.strings = StringTable()
+
+    def encode(self, obj):
+        if isinstance(obj, RecordStore):
+            return self._store(obj)
+        if _is_table(obj):
+            return {"$cols": {key: self._column([r[key] for r in obj]) for key in obj[0]}}
+        if isinstance(obj, dict):
+            return {k: self.encode(v) for k, v in obj.items()}
+        if isinstance(obj, list):
+            return [self.encode(v) for v in obj]
+        return obj
+
+    def _column(self, values):
+        if _text_column(values):
+            return {"$s": [self.strings.code(v) for v in values]}
+        return [self.encode(v) for v in values]
+
+    def _store(self, store):
+        # Straight from the column arrays; no per-record dicts
+        if not len(store):
+            return []
+        cols = {}
+        for name, kind in store.fields.items():
+            values = store.column(name)
+            cols[name] = {"$s": self.strings.codes(values).tolist()} if kind == STR else values.tolist()
+        return {"$cols": cols}
+
+
+def encode(obj):
+    """The columnar document for a JSON-serializable object (RecordStores allowed)."""
+    encoder = _Encoder()
+    data = encoder.encode(obj)
+    return {"format": FORMAT, "strings": encoder.strings.strings, "data": data}
+
+def decode(doc):
+    """The original object from a columnar document."""
+    strings = doc["strings"]
+
+    def column(col):
+        if isinstance(col, dict):
+            return [strings[c] if c >= 0 else None for c in col["$s"]]
+        return [walk(v) for v in col]
+
+    def walk(node):
+        if isinstance(node, dict):
+            if "$cols" in node:
+                cols = {key: column(col) for key, col in node["$cols"].items()}
+                return [dict(zip(cols, row)) for row in zip(*cols.values())]
+            return {k: walk(v) for k, v in node.items()}
+        if isinstance(node, list):
+            return [walk(v) for v in node]
+        return node
+
+    return walk(doc["data"])
+
+def dumps(obj):
+    return json.dumps(encode(obj), ensure_ascii=False, separators=(",", ":"))
+
+def compact_path(path):
+    """foo.json -> foo.columnar.json"""
+    return os.path.splitext(path)[0] + ".columnar.json"
+
+def write_compact(obj, path):
+    """Write the columnar copy of obj next to the already written `path` and report both sizes."""
+    out = compact_path(path)
+    with open(out, 'w', encoding='utf-8') as f:
+        f.write(dumps(obj))
+    print(size_report(path, out))
+    return out
+
+def _size(n):
+    return f"{n / 1024 / 1024:.2f} MB" if n >= 1024 * 1024 else f"{n / 1024:.1f} KB"
+
+def size_report(before, after):
+    a, b = os.path.getsize(before), os.path.getsize(after)
+    return f"  {before} {_size(a)} -> {after} {_size(b)} ({b / a:.0%})"
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a columnar .columnar.json copy of each JSON file and report sizes")
+    parser.add_argument("files", nargs="+")
+    args = parser.parse_args()
+    for path in args.files:
+        with open(path, encoding='utf-8') as f:
+            write_compact(json.load(f), path)
+
+if __name__ == "__main__":
+    main()
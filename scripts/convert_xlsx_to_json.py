@@ -2,6 +2,14 @@ import os
 import pandas as pd
 import json
 import re
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from workbook_loader import read_workbook, set_cache_enabled
+from record_sink import RecordSink
+from columnar_json import write_compact
+from timing import session, span, timed
+from transform_utils import HeaderIndex, build_arg_parser, run_years, iter_years, text_column, clean_number_array, clean_number_list, fill_hierarchy
 
 # Configuration
 BASE_DIR = os.path.abspath("docs/tw-finance")
@@ -20,26 +28,13 @@ def clean_str(val):
         return ""
     return str(val).strip().replace('\n', '').replace('　', ' ')
 
-def parse_amount(val):
-    if pd.isna(val):
-        return 0
-    try:
-        # Handle "15,676,552" or similar
-        clean = str(val).replace(',', '').replace(' ', '')
-        if clean == '-' or clean == '':
-            return 0
-        return int(float(clean))
-    except (ValueError, TypeError):
-        return 0
+def clean_str_column(col):
+    """Vectorized clean_str over a whole column."""
+    return text_column(col).str.strip().str.replace('\n', '', regex=False).str.replace('　', ' ', regex=False)
 
 def find_header_row(df, keywords):
     """Finds the index of the row containing at least 2 of the keywords."""
-    for i, row in df.head(15).iterrows():
-        row_str = " ".join([str(x) for x in row.values])
-        matches = sum(1 for k in keywords if k in row_str)
-        if matches >= 2:
-            return i
-    return None
+    return HeaderIndex(df, 15).first_row(keywords)
 
 def find_col_index(row_values, keywords):
     """Finds column index for a keyword."""
@@ -52,6 +47,7 @@ def find_col_index(row_values, keywords):
 
 # --- Processors ---
 
+@timed("extract")
 def process_funds(filepath, year):
     """
     C基金別預算分析表.xlsx -> funds.json
@@ -59,7 +55,7 @@ def process_funds(filepath, year):
     """
     data = []
     try:
-        df = pd.read_excel(filepath, header=None)
+        df = read_workbook(filepath)
         
         # Heuristic: Find header row with "基金" and "名稱" or similar
         # Usually it's around row 0-5.
@@ -85,6 +81,10 @@ def process_funds(filepath, year):
              if ec is not None: exp_col = ec
              start_row = header_row_idx + 1
 
+        # Amounts are cleaned a whole column at a time; the row loop only picks them up
+        incomes = clean_number_list(df, inc_col)
+        expenses = clean_number_list(df, exp_col)
+
         for i in range(start_row, len(df)):
             row = df.iloc[i]
             name = clean_str(row[name_col])
@@ -96,8 +96,8 @@ def process_funds(filepath, year):
             # Additional check: If Col 1 (Unit) exists and is empty, it might be an aggregate header?
             # For simplicity, if it has income/expense, we take it.
             
-            inc = parse_amount(row[inc_col]) if inc_col < len(row) else 0
-            exp = parse_amount(row[exp_col]) if exp_col < len(row) else 0
+            inc = incomes[i]
+            exp = expenses[i]
             
             if inc == 0 and exp == 0:
                 continue
@@ -114,6 +114,7 @@ def process_funds(filepath, year):
         print(f"Error processing Funds {filepath}: {e}")
     return data
 
+@timed("extract")
 def process_summary(filepath, year):
     """
     C歲入歲出簡明比較分析表.xlsx -> summary.json
@@ -121,13 +122,14 @@ def process_summary(filepath, year):
     """
     data = []
     try:
-        df = pd.read_excel(filepath, header=None)
+        df = read_workbook(filepath)
         
         # Scan for header
         header_row_idx = find_header_row(df, ["項目", "預算數", "比較"])
         start_row = 0 if header_row_idx is None else header_row_idx + 1
         
         curr_type = "Revenue" # Default start
+        amounts = clean_number_list(df, 1)
         
         for i in range(start_row, len(df)):
             row = df.iloc[i]
@@ -146,7 +148,7 @@ def process_summary(filepath, year):
                 continue
                 
             # Amount is usually Col 1
-            amt = parse_amount(row[1])
+            amt = amounts[i]
             
             if amt != 0:
                 data.append({
@@ -160,6 +162,7 @@ def process_summary(filepath, year):
         print(f"Error processing Summary {filepath}: {e}")
     return data
 
+@timed("extract")
 def process_hierarchy(filepath, year, json_type):
     """
     Generic hierarchical processor for:
@@ -169,7 +172,7 @@ def process_hierarchy(filepath, year, json_type):
     """
     data = []
     try:
-        df = pd.read_excel(filepath, header=None)
+        df = read_workbook(filepath)
         
         # 1. Identify Columns
         # Keywords map
@@ -180,10 +183,11 @@ def process_hierarchy(filepath, year, json_type):
         amt_kw = ["本年度預算數", "預算案數", "預算數"]
         name_kw = ["科目", "名稱"]
         
-        header_row_idx = find_header_row(df, ["款", "項", "本年度預算數"])
+        header = HeaderIndex(df, 15)
+        header_row_idx = header.first_row(["款", "項", "本年度預算數"])
         if header_row_idx is None:
              # Fallback: Try row 0-5
-             header_row_idx = find_header_row(df, ["科目", "名稱"])
+             header_row_idx = header.first_row(["科目", "名稱"])
         
         start_row = 0
         if header_row_idx is not None:
@@ -203,75 +207,53 @@ def process_hierarchy(filepath, year, json_type):
              print(f"  Warning: Missing K or Amt column in {os.path.basename(filepath)}")
              return []
 
-        # State vars
-        curr_k = ""
-        curr_x = ""
-        curr_m = ""
-        curr_j = ""
+        # Column-wise extraction
+        body = df.iloc[start_row:]
+
+        def column(idx):
+            if idx is None or idx >= df.shape[1]:
+                return pd.Series("", index=body.index, dtype=object)
+            return clean_str_column(body[df.columns[idx]])
+
+        # Each level takes the row's name if there is a name column, else the marker text itself
+        row_name = column(name_idx)
+        markers = [column(idx) for idx in (k_idx, x_idx, m_idx, j_idx)]
+        labels = [row_name.where(row_name != "", m) for m in markers]
+        curr_k, curr_x, curr_m, curr_j = fill_hierarchy(labels, [m != "" for m in markers])
+
+        if amt_idx < df.shape[1]:
+            amount_values, unparseable = clean_number_array(body[df.columns[amt_idx]])
+            amounts = pd.Series(amount_values, index=body.index)
+            if unparseable.any():
+                print(f"  Warning: {unparseable.sum()} unparseable amount cells in {os.path.basename(filepath)} counted as 0")
+        else:
+            amounts = pd.Series(0, index=body.index, dtype='int64')
+
+        keep = (amounts != 0) & (curr_k != "")
+        ad_year = get_ad_year(year)
+        fields = [amounts[keep].tolist(), curr_k[keep].tolist(), curr_x[keep].tolist(),
+                  curr_m[keep].tolist(), curr_j[keep].tolist()]
         
-        for i in range(start_row, len(df)):
-            row = df.iloc[i]
-            
-            # Helper to safely get value at index
-            def get_val(idx):
-                if idx is not None and idx < len(row):
-                    return clean_str(row[idx])
-                return ""
-            
-            # Extract name if specific name column exists
-            row_name = get_val(name_idx) if name_idx is not None else ""
-            
-            # Update Hierarchy
-            # If a marker column has content, update state.
-            
-            k_val = get_val(k_idx)
-            if k_val:
-                curr_k = row_name if row_name else k_val
-                curr_x = ""
-                curr_m = ""
-                curr_j = ""
-            
-            x_val = get_val(x_idx) if x_idx is not None else ""
-            if x_val:
-                curr_x = row_name if row_name else x_val
-                curr_m = ""
-                curr_j = ""
-                
-            m_val = get_val(m_idx) if m_idx is not None else ""
-            if m_val:
-                curr_m = row_name if row_name else m_val
-                curr_j = ""
-                
-            j_val = get_val(j_idx) if j_idx is not None else ""
-            if j_val:
-                curr_j = row_name if row_name else j_val
-                
+        for amt, k, x, m, j in zip(*fields):
             # Formatting for specific JSON Types
-            amt = parse_amount(row[amt_idx]) if amt_idx < len(row) else 0
-            
-            if amt == 0: continue
-            
-            entry = {"year": get_ad_year(year), "amount": amt}
+            entry = {"year": ad_year, "amount": amt}
             
             if json_type == "revenue_by_source":
                 # K, X, M (No J usually)
-                if not curr_k: continue
-                entry["top_category"] = curr_k
-                entry["sub_category"] = curr_x
-                entry["detail_item"] = curr_m
+                entry["top_category"] = k
+                entry["sub_category"] = x
+                entry["detail_item"] = m
                 
             elif json_type == "expenditure_by_agency":
-                if not curr_k: continue
-                entry["agency_top"] = curr_k
-                entry["agency_sub"] = curr_x
-                entry["program"] = curr_m
-                entry["account"] = curr_j
+                entry["agency_top"] = k
+                entry["agency_sub"] = x
+                entry["program"] = m
+                entry["account"] = j
                 
             elif json_type == "expenditure_by_function":
-                if not curr_k: continue
-                entry["function_top"] = curr_k
-                entry["function_sub"] = curr_x
-                entry["program"] = curr_m
+                entry["function_top"] = k
+                entry["function_sub"] = x
+                entry["program"] = m
             
             data.append(entry)
             
@@ -280,58 +262,118 @@ def process_hierarchy(filepath, year, json_type):
     return data
 
 
+def process_year_dir(year):
+    """
+    Extracts every recognised workbook of one fiscal year.
+    Returns {output json filename: records}; this is the unit of work handed to the process pool.
+    """
+    year_data = {
+        "funds.json": [],
+        "summary.json": [],
+        "revenue_by_source.json": [],
+        "expenditure_by_agency.json": [],
+        "expenditure_by_function.json": [],
+    }
+    year_dir = os.path.join(BASE_DIR, str(year))
+    if not os.path.exists(year_dir):
+        return year_data
+        
+    print(f"Processing Year {year}...")
+    
+    for filename in os.listdir(year_dir):
+        if filename.startswith("~") or not (filename.endswith(".xls") or filename.endswith(".xlsx")):
+            continue
+        
+        filepath = os.path.join(year_dir, filename)
+        
+        # Identify File
+        # 1. Funds
+        if "基金別預算分析表" in filename or "基金別" in filename:
+            print(f"  Funds: {filename}")
+            year_data["funds.json"].extend(process_funds(filepath, year))
+            
+        # 2. Summary
+        elif "簡明比較" in filename:
+            print(f"  Summary: {filename}")
+            year_data["summary.json"].extend(process_summary(filepath, year))
+            
+        # 3. Revenue Source
+        elif "歲入來源別" in filename:
+            print(f"  Revenue Source: {filename}")
+            year_data["revenue_by_source.json"].extend(process_hierarchy(filepath, year, "revenue_by_source"))
+            
+        # 4. Exp Agency
+        elif "歲出機關別" in filename:
+            print(f"  Exp Agency: {filename}")
+            year_data["expenditure_by_agency.json"].extend(process_hierarchy(filepath, year, "expenditure_by_agency"))
+            
+        # 5. Exp Function
+        elif "歲出政事別" in filename:
+            print(f"  Exp Function: {filename}")
+            year_data["expenditure_by_function.json"].extend(process_hierarchy(filepath, year, "expenditure_by_function"))
+
+    return year_data
+
+
+OUTPUT_FILES = ["funds.json", "summary.json", "revenue_by_source.json",
+                "expenditure_by_agency.json", "expenditure_by_function.json"]
+
+def stream_json(args):
+    """--stream: append each finished year to the JSON arrays instead of collecting every year first."""
+    sinks = {filename: RecordSink(os.path.join(OUTPUT_DIR, filename), "json") for filename in OUTPUT_FILES}
+    for year_data in iter_years(process_year_dir, TARGET_YEARS, args, BASE_DIR):
+        with span("serialize"):
+            for filename, records in year_data.items():
+                sinks[filename].write(records)
+    for filename, sink in sinks.items():
+        with span("serialize"):
+            sink.close()
+        print(f"Saved {filename}: {sink.count} records")
+
 def main():
+    parser = build_arg_parser("Convert docs/tw-finance workbooks to JSON in data/unified")
+    parser.add_argument("--stream", action="store_true",
+                        help="Write records year by year instead of holding every year in memory")
+    parser.add_argument("--compact", action="store_true",
+                        help="Also write minified columnar copies (<name>.columnar.json, see columnar_json.py) and report sizes; not with --stream")
+    args = parser.parse_args()
+    if args.stream and args.compact:
+        # The columnar encoder needs every year at once, which --stream never holds
+        parser.error("--compact cannot be combined with --stream")
+    with session(args):
+        run(args)
+
+def run(args):
+    set_cache_enabled(not args.no_cache)
+
+    if args.stream:
+        stream_json(args)
+        return
+
     all_funds = []
     all_summary = []
     all_rev_source = []
     all_exp_agency = []
     all_exp_func = []
     
-    for year in TARGET_YEARS:
-        year_dir = os.path.join(BASE_DIR, str(year))
-        if not os.path.exists(year_dir):
-            continue
-            
-        print(f"Processing Year {year}...")
-        
-        for filename in os.listdir(year_dir):
-            if filename.startswith("~") or not (filename.endswith(".xls") or filename.endswith(".xlsx")):
-                continue
-            
-            filepath = os.path.join(year_dir, filename)
-            
-            # Identify File
-            # 1. Funds
-            if "基金別預算分析表" in filename or "基金別" in filename:
-                print(f"  Funds: {filename}")
-                all_funds.extend(process_funds(filepath, year))
-                
-            # 2. Summary
-            elif "簡明比較" in filename:
-                print(f"  Summary: {filename}")
-                all_summary.extend(process_summary(filepath, year))
-                
-            # 3. Revenue Source
-            elif "歲入來源別" in filename:
-                print(f"  Revenue Source: {filename}")
-                all_rev_source.extend(process_hierarchy(filepath, year, "revenue_by_source"))
-                
-            # 4. Exp Agency
-            elif "歲出機關別" in filename:
-                print(f"  Exp Agency: {filename}")
-                all_exp_agency.extend(process_hierarchy(filepath, year, "expenditure_by_agency"))
-                
-            # 5. Exp Function
-            elif "歲出政事別" in filename:
-                print(f"  Exp Function: {filename}")
-                all_exp_func.extend(process_hierarchy(filepath, year, "expenditure_by_function"))
+    # Results come back in year order, so the JSON matches the serial run
+    for year_data in run_years(process_year_dir, TARGET_YEARS, args, BASE_DIR):
+        with span("aggregate"):
+            all_funds.extend(year_data["funds.json"])
+            all_summary.extend(year_data["summary.json"])
+            all_rev_source.extend(year_data["revenue_by_source.json"])
+            all_exp_agency.extend(year_data["expenditure_by_agency.json"])
+            all_exp_func.extend(year_data["expenditure_by_function.json"])
                 
     # Save Files
     def save_json(data, filename):
         path = os.path.join(OUTPUT_DIR, filename)
-        with open(path, 'w', encoding='utf-8') as f:
+        with span("serialize"), open(path, 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
         print(f"Saved {filename}: {len(data)} records")
+        if args.compact:
+            with span("serialize"):
+                write_compact(data, path)
 
     save_json(all_funds, "funds.json")
     save_json(all_summary, "summary.json")
@@ -1,8 +1,17 @@
 import os
 import re
+import sys
+import shutil
 import pandas as pd
 from datetime import datetime
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from workbook_loader import WorkbookCache, probe_workbook, read_workbook, set_cache_enabled
+from record_sink import RecordSink, jsonl_text
+from record_store import RecordStore, StringTable, STR, INT
+from timing import session, span, timed
+from transform_utils import HeaderIndex, build_arg_parser, iter_years, text_column, clean_number_array, clean_number_list, fill_hierarchy
+
 # Configuration
 BASE_DIR = os.path.abspath("docs/tw-finance")
 OUTPUT_DIR = os.path.abspath("data/unified")
@@ -14,15 +23,18 @@ def get_year_from_dir(dirname):
     except ValueError:
         return None
 
-def identify_file_type(filepath):
+@timed("classify")
+def identify_file_type(filepath, header=None):
     """
     Identifies if it is an Expenditure, Revenue, or Analysis file.
     Priority: Content > Filename
+    header: HeaderIndex of the first 20 rows, if the caller already has the sheet loaded.
     """
     try:
-        # Read the first few rows to inspect headers (Increase to 20 to catch data)
-        df_head = pd.read_excel(filepath, nrows=20, header=None)
-        content_str = df_head.to_string()
+        if header is None:
+            # Read the first few rows to inspect headers (Increase to 20 to catch data)
+            header = HeaderIndex(probe_workbook(filepath))
+        content_str = header.text
         
         # Content Keywords (Headers)
         has_agency_kw = "機關" in content_str
@@ -63,39 +75,13 @@ def find_column_index(df_head, keywords):
     Scans the first few rows to find the column index containing any of the keywords.
     Returns: column index (int) or None
     """
-    # First pass: Exact match (after cleaning)
-    for row_idx, row in df_head.iterrows():
-        for col_idx, val in enumerate(row):
-            str_val = str(val).strip().replace('\n', '').replace(' ', '').replace('　', '')
-            if str_val in keywords:
-                return col_idx
-                
-    # Second pass: Partial match (only if strict match failed? Or strictly for longer keywords?)
-    # For '款', '項' etc, we really want exact match to avoid '科目'.
-    # But for '本年度預算數', we might want partial.
-    
-    for row_idx, row in df_head.iterrows():
-        for col_idx, val in enumerate(row):
-            str_val = str(val).strip().replace('\n', '').replace(' ', '').replace('　', '')
-            # Only do partial match if the keyword is not a single character, 
-            # OR if we are desperate. 
-            # Let's filter: keywords that are len 1 MUST be exact match.
-            for k in keywords:
-                if len(k) == 1:
-                    if k == str_val: return col_idx
-                else:
-                    if k in str_val: return col_idx
-    return None
+    return HeaderIndex(df_head, len(df_head)).column(keywords, len(df_head))
 
 def find_header_row(df_head, keywords):
     """
     Finds the row index where most keywords appear.
     """
-    for row_idx, row in df_head.iterrows():
-        matches = sum(1 for val in row if any(k in str(val).strip() for k in keywords))
-        if matches >= 2: # At least 2 matches (e.g., 款, 項)
-            return row_idx
-    return None
+    return HeaderIndex(df_head, len(df_head)).first_row_by_cells(keywords, len(df_head))
 
 def extract_name(val):
     """
@@ -108,149 +94,112 @@ def extract_name(val):
     # Handle wide spaces?
     return s.replace('　', ' ').strip()
 
-def process_generic(filepath, year, budget_type, keys_map):
+def process_generic(filepath, year, budget_type, keys_map, df=None, header=None):
     """
     Generic processor for both Rev and Exp.
     keys_map: {'k': ['款'], 'x': ['項'], 'm': ['目'], 'j': ['節'], 'amt': ['本年度預算數', '預算案數'], 'name': ['名稱']}
+    df: already-parsed sheet (header=None); read from filepath if not given.
+    header: HeaderIndex of df, if the caller already built one.
     """
+    out = generic_frame(filepath, year, budget_type, keys_map, df, header)
+    return [] if out is None else out.to_dict('records')
+
+@timed("extract")
+def generic_frame(filepath, year, budget_type, keys_map, df=None, header=None):
+    """process_generic as a DataFrame (one row per record), or None when the sheet is unusable."""
     try:
-        df = pd.read_excel(filepath, header=None)
+        if df is None:
+            df = read_workbook(filepath)
+        if header is None:
+            header = HeaderIndex(df)
         
         # Determine Header Scan Range (114 has headers at top, 110 at row 4)
-        df_head = df.head(15) 
+        scan_rows = 15
         
         # 1. Identify Column Indices
         col_indices = {}
         for key, keywords in keys_map.items():
-            col_idx = find_column_index(df_head, keywords)
+            col_idx = header.column(keywords, scan_rows)
             col_indices[key] = col_idx
             
         # Check critical columns
         if col_indices['k'] is None or col_indices['amt'] is None:
             # print(f"Skipping {os.path.basename(filepath)}: Missing critical columns (K or Amt). Found: {col_indices}")
-            return []
+            return None
 
         # 2. Find Data Start Row (Row after the header row)
         # We need to look for a row containing typical header tokens
         header_keywords = ['款', '項', '目', '節', '代號', '名稱', '預算數']
         start_row = 0
-        header_row = find_header_row(df_head, header_keywords)
+        header_row = header.first_row_by_cells(header_keywords, scan_rows)
         if header_row is not None:
             start_row = header_row + 1
             
-        # 3. Iterate
-        rows = []
-        
-        # State
-        curr_k = ""
-        curr_x = ""
-        curr_m = ""
-        curr_j = ""
-        
-        # Helper to get val
-        def get_val(row, key):
+        # 3. Extract column-wise
+        body = df.iloc[start_row:]
+
+        # A cell marks its level when it is non-blank and truthy (matches the old per-row get_val checks)
+        def marker(key):
             idx = col_indices.get(key)
-            if idx is None: return None
-            val = row[idx]
-            if pd.isna(val) or str(val).strip() == "": return None
-            return val
+            if idx is None:
+                return pd.Series(False, index=body.index)
+            col = body[df.columns[idx]]
+            return (text_column(col).str.strip() != "") & col.astype(bool)
 
-        for i in range(start_row, len(df)):
-            row = df.iloc[i]
-            
-            # Name extraction
-            raw_name = get_val(row, 'name')
-            name = extract_name(raw_name) if raw_name else ""
-            
-            # Values
-            k_val = get_val(row, 'k') 
-            x_val = get_val(row, 'x')
-            m_val = get_val(row, 'm')
-            j_val = get_val(row, 'j')
-            
-            # Hierarchy Update & Reset Logic
-            # Note: k_val, x_val etc are markers. If present, it means specific level is defined.
-            
-            if k_val: 
-                curr_k = name
-                curr_x = "" # Reset lower
-                curr_m = ""
-                curr_j = ""
-            if x_val: 
-                curr_x = name
-                curr_m = ""
-                curr_j = ""
-            if m_val: 
-                curr_m = name
-                curr_j = ""
-            if j_val: 
-                curr_j = name
-            
-            # Amount
-            amt_val = get_val(row, 'amt')
-            
-            val = 0
-            has_amt = False
-            if amt_val is not None:
-                try:
-                    # Handle "15,676,552" (string with commas)
-                    # Handle " - " or similar
-                    clean_amt = str(amt_val).replace(',', '').replace(' ', '')
-                    val = float(clean_amt) # Use float then int
-                    val = int(val)
-                    if val != 0: has_amt = True
-                except:
-                    pass
-            
-            if has_amt:
-                valid = False
-                if budget_type == "Expenditure":
-                    # Capture lowest level available.
-                    # In 110/114, "一般行政" (Program/目) has an amount. The items under it might be breakdown.
-                    # Or "一般行政" might be the sum.
-                    # Let's Capture ALL rows with amount to be safe, users can filter by 'level' if we added it?
-                    # Unified Schema doesn't have level.
-                    # Standard practice: Include all. Dashboard needs to handle hierarchy.
-                    valid = True
-                else: 
-                    valid = True
-                
-                if valid:
-                     rows.append({
-                        "year": 1911 + int(year),
-                        "type": budget_type,
-                        "category_1": curr_k,
-                        "category_2": curr_x,
-                        "item_name": curr_m,
-                        "account_name": curr_j,
-                        "amount": val,
-                        "source_file": os.path.basename(filepath)
-                    })
+        name_idx = col_indices.get('name')
+        if name_idx is not None:
+            name_text = text_column(body[df.columns[name_idx]]).str.strip()
+            # extract_name: last line of 'Code\nName', else the cell with wide spaces normalised
+            names = name_text.str.rsplit('\n', n=1).str[-1].str.strip().where(
+                name_text.str.contains('\n', regex=False),
+                name_text.str.replace('　', ' ', regex=False).str.strip())
+            names = names.where(marker('name'), "")
+        else:
+            names = pd.Series("", index=body.index, dtype=object)
 
-        return rows
+        curr_k, curr_x, curr_m, curr_j = fill_hierarchy(
+            [names] * 4, [marker('k'), marker('x'), marker('m'), marker('j')])
+
+        # Amount: "15,676,552" strings or floats; blanks and unparseable cells count as 0
+        amount_values, unparseable = clean_number_array(body[df.columns[col_indices['amt']]])
+        amounts = pd.Series(amount_values, index=body.index)
+        if unparseable.any():
+            print(f"  Warning: {unparseable.sum()} unparseable amount cells in {os.path.basename(filepath)} counted as 0")
+
+        # Expenditure and Revenue both keep every row with an amount; the dashboard handles hierarchy
+        has_amt = amounts != 0
+        out = pd.DataFrame({
+            "year": 1911 + int(year),
+            "type": budget_type,
+            "category_1": curr_k[has_amt],
+            "category_2": curr_x[has_amt],
+            "item_name": curr_m[has_amt],
+            "account_name": curr_j[has_amt],
+            "amount": amounts[has_amt],
+            "source_file": os.path.basename(filepath)
+        })
+        return out
 
     except Exception as e:
         print(f"Error processing {filepath}: {e}")
-        return []
+        return None
+
+# Column keywords of the Expenditure and Revenue tables
+BUDGET_KEYS = {
+    'k': ['款'], 'x': ['項'], 'm': ['目'], 'j': ['節'], 
+    'amt': ['本年度預算數', '預算案數'], 
+    'name': ['名稱'] # Removed '科目' to avoid matching col 0
+}
 
-def process_expenditure(filepath, year):
-    keys = {
-        'k': ['款'], 'x': ['項'], 'm': ['目'], 'j': ['節'], 
-        'amt': ['本年度預算數', '預算案數'], 
-        'name': ['名稱'] # Removed '科目' to avoid matching col 0
-    }
-    return process_generic(filepath, year, "Expenditure", keys)
+def process_expenditure(filepath, year, df=None, header=None):
+    return process_generic(filepath, year, "Expenditure", BUDGET_KEYS, df, header)
 
-def process_revenue(filepath, year):
-    keys = {
-        'k': ['款'], 'x': ['項'], 'm': ['目'], 'j': ['節'], 
-        'amt': ['本年度預算數', '預算案數'], 
-        'name': ['名稱']
-    }
-    return process_generic(filepath, year, "Revenue", keys)
+def process_revenue(filepath, year, df=None, header=None):
+    return process_generic(filepath, year, "Revenue", BUDGET_KEYS, df, header)
 
 
-def process_fund(filepath, year):
+@timed("extract")
+def process_fund(filepath, year, df=None):
     """
     Extracts Fund data.
     Schema: Fund Name, Income, Expense, Surplus
@@ -260,7 +209,8 @@ def process_fund(filepath, year):
     We ONLY want leaf nodes.
     """
     try:
-        df = pd.read_excel(filepath, header=None)
+        if df is None:
+            df = read_workbook(filepath)
         
         # Find header row containing '基金'
         start_row = 0
@@ -271,6 +221,9 @@ def process_fund(filepath, year):
         
         inc_col = 2
         exp_col = 3
+        # Amounts are cleaned a whole column at a time; the row loop only picks them up
+        incomes = clean_number_list(df, inc_col)
+        expenses = clean_number_list(df, exp_col)
         
         rows = []
         for i in range(start_row, len(df)):
@@ -290,18 +243,8 @@ def process_fund(filepath, year):
             if '名稱' in name or '收入' in name:
                 continue
                 
-            inc_val = row[inc_col]
-            exp_val = row[exp_col]
-            
-            # Parse amounts
-            def parse(v):
-                try: 
-                    return int(float(str(v).replace(',', '').strip()))
-                except: 
-                    return 0
-            
-            inc = parse(inc_val)
-            exp = parse(exp_val)
+            inc = incomes[i]
+            exp = expenses[i]
             surplus = inc - exp
             
             # Only add if it looks like data
@@ -319,14 +262,16 @@ def process_fund(filepath, year):
         print(f"Error processing Fund {filepath}: {e}")
         return []
 
-def process_summary(filepath, year):
+@timed("extract")
+def process_summary(filepath, year, df=None):
     """
     Extracts Summary data.
     Schema: Category, Amount
     Structure: Col 0 = Category, Col 1 = Amount
     """
     try:
-        df = pd.read_excel(filepath, header=None)
+        if df is None:
+            df = read_workbook(filepath)
         
         start_row = 0
         for i, row in df.head(10).iterrows():
@@ -371,99 +316,232 @@ def process_summary(filepath, year):
         print(f"Error processing Summary {filepath}: {e}")
         return []
 
-def main():
-    if not os.path.exists(OUTPUT_DIR):
-        os.makedirs(OUTPUT_DIR)
+# Output schemas, in CSV column order
+BUDGET_FIELDS = {"year": INT, "type": STR, "category_1": STR, "category_2": STR, "item_name": STR,
+                 "account_name": STR, "amount": INT, "source_file": STR}
+FUND_FIELDS = {"year": INT, "fund_name": STR, "income": INT, "expense": INT, "surplus": INT, "source_file": STR}
+SUMMARY_FIELDS = {"year": INT, "category": STR, "amount": INT, "source_file": STR}
+
+# Output tables: (name, schema); text columns are dictionary-encoded and numbers int64 in Parquet
+TABLES = [
+    ("budget_all", BUDGET_FIELDS),
+    ("funds_all", FUND_FIELDS),
+    ("summary_all", SUMMARY_FIELDS),
+]
+
+def text_fields(fields):
+    return [name for name, kind in fields.items() if kind == STR]
+
+def int_fields(fields):
+    return [name for name, kind in fields.items() if kind == INT]
+
+def process_year_dir(year):
+    """
+    Extracts every workbook of one fiscal year.
+    Returns (budget_rows, fund_rows, summary_rows, parse_counts), the rows as RecordStores
+    sharing one string table; years are independent, so this is the unit of work handed to the process pool.
+    """
+    strings = StringTable()
+    budget_data = RecordStore(BUDGET_FIELDS, strings) # Unified Exp/Rev
+    funds_data = RecordStore(FUND_FIELDS, strings)
+    summary_data = RecordStore(SUMMARY_FIELDS, strings)
+    # Each workbook is parsed once and shared by classification and extraction
+    workbooks = WorkbookCache()
+
+    year_dir = os.path.join(BASE_DIR, str(year))
+    if not os.path.exists(year_dir):
+        print(f"Directory not found for year {year}, skipping.")
+        return budget_data, funds_data, summary_data, workbooks.parse_counts
         
-    budget_data = [] # Unified Exp/Rev
-    funds_data = []
-    summary_data = []
+    print(f"Processing Year {year}...")
     
-    for year in TARGET_YEARS:
-        year_dir = os.path.join(BASE_DIR, str(year))
-        if not os.path.exists(year_dir):
-            print(f"Directory not found for year {year}, skipping.")
+    with span("discover"):
+        filenames = [f for f in os.listdir(year_dir)
+                     if not f.startswith("~") and (f.endswith(".xls") or f.endswith(".xlsx"))]
+
+    for filename in filenames:
+        filepath = os.path.join(year_dir, filename)
+        
+        # Identification Logic
+        
+        # Probe the header rows first for content-based ID; they are indexed once and answer the
+        # classification, header-row and column lookups below. Only files that turn out to be
+        # Fund/Summary/Exp/Rev tables are parsed in full.
+        head = workbooks.probe(filepath)
+        if head is None:
+            workbooks.release(filepath)
             continue
-            
-        print(f"Processing Year {year}...")
+        header = HeaderIndex(head)
+
+        # 1. Check for SPECIAL files first (Fund, Summary)
         
-        for filename in os.listdir(year_dir):
-            if filename.startswith("~") or not (filename.endswith(".xls") or filename.endswith(".xlsx")):
-                continue
-                
-            filepath = os.path.join(year_dir, filename)
+        # Funds
+        is_fund = False
+        if "基金別" in filename and "分析表" in filename: 
+            is_fund = True
+        elif header.contains("基金別預算分析表"): 
+            is_fund = True
+        
+        if is_fund:
+            print(f"  Found Funds: {filename}")
+            df = workbooks.read(filepath)
+            if df is not None:
+                funds_data.extend(process_fund(filepath, year, df))
+            workbooks.release(filepath)
+            continue
             
-            # Identification Logic
+        # Summary
+        is_summary = False
+        if "簡明比較" in filename: 
+            is_summary = True
+        elif header.contains("簡明比較") or (header.contains("歲入合計") and header.contains("歲出合計")): 
+            is_summary = True
             
-            # Read header first for content-based ID
-            header_content = ""
-            try:
-                df_head_scan = pd.read_excel(filepath, nrows=20, header=None)
-                header_content = df_head_scan.to_string()
-            except:
-                pass
+        if is_summary:
+            print(f"  Found Summary: {filename}")
+            df = workbooks.read(filepath)
+            if df is not None:
+                summary_data.extend(process_summary(filepath, year, df))
+            workbooks.release(filepath)
+            continue
+        
+        # 2. Else, try to identify as Main Budget (Exp/Rev)
+        file_type = identify_file_type(filepath, header)
+        
+        if file_type in ("Expenditure", "Revenue"):
+            print(f"  Found {file_type}: {filename}")
+            df = workbooks.read(filepath)
+            # Straight from the extracted frame into the store, without per-row dicts
+            out = generic_frame(filepath, year, file_type, BUDGET_KEYS, df, header) if df is not None else None
+            if out is not None:
+                budget_data.extend_frame(out)
+        else:
+             # print(f"  Unknown File: {filename} | Content: {header.text[:100]}...")
+             pass
+        workbooks.release(filepath)
 
-            # 1. Check for SPECIAL files first (Fund, Summary)
-            
-            # Funds
-            is_fund = False
-            if "基金別" in filename and "分析表" in filename: 
-                is_fund = True
-            elif "基金別預算分析表" in header_content: 
-                is_fund = True
-            
-            if is_fund:
-                print(f"  Found Funds: {filename}")
-                funds_data.extend(process_fund(filepath, year))
-                continue
-                
-            # Summary
-            is_summary = False
-            if "簡明比較" in filename: 
-                is_summary = True
-            elif "簡明比較" in header_content or ("歲入合計" in header_content and "歲出合計" in header_content): 
-                is_summary = True
-                
-            if is_summary:
-                print(f"  Found Summary: {filename}")
-                summary_data.extend(process_summary(filepath, year))
-                continue
-            
-            # 2. Else, try to identify as Main Budget (Exp/Rev)
-            file_type = identify_file_type(filepath)
-            
-            if file_type == "Expenditure":
-                print(f"  Found Expenditure: {filename}")
-                data = process_expenditure(filepath, year)
-                budget_data.extend(data)
-            elif file_type == "Revenue":
-                print(f"  Found Revenue: {filename}")
-                data = process_revenue(filepath, year)
-                budget_data.extend(data)
+    return budget_data, funds_data, summary_data, workbooks.parse_counts
+
+@timed("serialize")
+def save_table(rows, name, formats, fields):
+    """
+    Writes rows (a RecordStore) as data/unified/<name>.csv and/or a <name>.parquet dataset partitioned by year.
+    Parquet stores the repeated text columns dictionary-encoded and amounts as int64,
+    so readers skip CSV parsing and dtype inference.
+    """
+    if not rows:
+        return
+    df = rows.to_frame()
+
+    if "csv" in formats:
+        output_csv = os.path.join(OUTPUT_DIR, f"{name}.csv")
+        df.to_csv(output_csv, index=False)
+        print(f"Successfully generated {output_csv} with {len(df)} rows.")
+
+    if "jsonl" in formats:
+        output_jsonl = os.path.join(OUTPUT_DIR, f"{name}.jsonl")
+        with open(output_jsonl, 'w', encoding='utf-8', newline='') as f:
+            f.write(jsonl_text(df))
+        print(f"Successfully generated {output_jsonl} with {len(df)} rows.")
+
+    if "parquet" in formats:
+        try:
+            import pyarrow # noqa: F401  (optional dependency, only needed for --format parquet)
+        except ImportError:
+            print(f"Skipping {name}.parquet: pyarrow is not installed (pip install pyarrow).")
+            return
+        typed = df.astype({col: "category" for col in text_fields(fields)})
+        typed = typed.astype({col: "int64" for col in int_fields(fields)})
+        output_dir = os.path.join(OUTPUT_DIR, f"{name}.parquet")
+        # to_parquet adds files to existing partitions, so start from an empty dataset
+        if os.path.exists(output_dir):
+            shutil.rmtree(output_dir)
+        typed.to_parquet(output_dir, engine="pyarrow", partition_cols=["year"], index=False)
+        print(f"Successfully generated {output_dir} with {len(df)} rows.")
+
+def check_parsed_once(counts):
+    """Fail the run when a workbook was loaded more than once (raised, so it also holds under python -O)."""
+    repeated = sorted(path for path, n in counts.items() if n != 1)
+    if repeated:
+        raise RuntimeError(f"Workbooks parsed more than once: {', '.join(repeated)}")
+
+def stream_tables(args, formats):
+    """
+    --stream: write each year's rows to chunked sinks as soon as the year is done,
+    so peak memory is one year of records however many years are ingested. Only the
+    writing is chunked: each year is still extracted whole, sheet by sheet.
+    """
+    sinks = []
+    for name, fields in TABLES:
+        table_sinks = []
+        for fmt in formats:
+            path = os.path.join(OUTPUT_DIR, f"{name}.{fmt}")
+            if fmt == "parquet":
+                if os.path.exists(path):
+                    shutil.rmtree(path)
+                table_sinks.append(RecordSink(path, fmt, categorical_cols=text_fields(fields),
+                                              int_cols=int_fields(fields), partition_col="year"))
             else:
-                 # print(f"  Unknown File: {filename} | Content: {header_content[:100]}...")
-                 pass
-
-    # Save Budget All
-    if budget_data:
-        df_all = pd.DataFrame(budget_data)
-        output_csv = os.path.join(OUTPUT_DIR, "budget_all.csv")
-        df_all.to_csv(output_csv, index=False)
-        print(f"Successfully generated {output_csv} with {len(df_all)} rows.")
+                table_sinks.append(RecordSink(path, fmt))
+        sinks.append(table_sinks)
+
+    workbooks = 0
+    for *year_tables, year_counts in iter_years(process_year_dir, TARGET_YEARS, args, BASE_DIR):
+        workbooks += len(year_counts)
+        check_parsed_once(year_counts)
+        with span("serialize"):
+            for table_sinks, rows in zip(sinks, year_tables):
+                for sink in table_sinks:
+                    sink.write(rows)
+    print(f"Parsed {workbooks} workbooks.")
+
+    for table_sinks in sinks:
+        for sink in table_sinks:
+            with span("serialize"):
+                sink.close()
+            if sink.count:
+                print(f"Successfully generated {sink.path} with {sink.count} rows.")
+
+def main():
+    parser = build_arg_parser("Build the unified budget/funds/summary tables in data/unified")
+    parser.add_argument("--format", default="csv",
+                        help="Comma-separated output formats: csv, jsonl, parquet (default: csv)")
+    parser.add_argument("--stream", action="store_true",
+                        help="Write rows year by year through chunked sinks instead of building each table in memory")
+    args = parser.parse_args()
+    with session(args):
+        run(args)
+
+def run(args):
+    set_cache_enabled(not args.no_cache)
+
+    if not os.path.exists(OUTPUT_DIR):
+        os.makedirs(OUTPUT_DIR)
+
+    formats = args.format.split(",")
+    if args.stream:
+        stream_tables(args, formats)
+        return
+        
+    strings = StringTable()
+    budget_data = RecordStore(BUDGET_FIELDS, strings) # Unified Exp/Rev
+    funds_data = RecordStore(FUND_FIELDS, strings)
+    summary_data = RecordStore(SUMMARY_FIELDS, strings)
+    parse_counts = {}
     
-    # Save Funds
-    if funds_data:
-        df_funds = pd.DataFrame(funds_data)
-        output_csv = os.path.join(OUTPUT_DIR, "funds_all.csv")
-        df_funds.to_csv(output_csv, index=False)
-        print(f"Successfully generated {output_csv} with {len(df_funds)} rows.")
-
-    # Save Summary
-    if summary_data:
-        df_sum = pd.DataFrame(summary_data)
-        output_csv = os.path.join(OUTPUT_DIR, "summary_all.csv")
-        df_sum.to_csv(output_csv, index=False)
-        print(f"Successfully generated {output_csv} with {len(df_sum)} rows.")
+    # Results come back in year order, so the CSVs match the serial run
+    for year_budget, year_funds, year_summary, year_counts in iter_years(process_year_dir, TARGET_YEARS, args, BASE_DIR):
+        with span("aggregate"):
+            budget_data.extend_store(year_budget)
+            funds_data.extend_store(year_funds)
+            summary_data.extend_store(year_summary)
+            parse_counts.update(year_counts)
+
+    print(f"Parsed {len(parse_counts)} workbooks.")
+    check_parsed_once(parse_counts)
+
+    for (name, fields), rows in zip(TABLES, [budget_data, funds_data, summary_data]):
+        save_table(rows, name, formats, fields)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,244 @@
+"""
+Load the pipeline outputs into one indexed database file for ad-hoc SQL over all years,
+instead of re-parsing the JSON/CSV outputs on every query.
+
+Tables (each only when its input exists):
+    budget          data/unified/budget_all.csv    (etl_budget.py)
+    funds           data/unified/funds_all.csv
+    summary         data/unified/summary_all.csv
+    summary_categories, summary_totals              data/json/summary.json
+    nodes           the 款/項/目/節 hierarchy of data/json/{revenue_by_source,expenditure_by_function,
+                    expenditure_by_agency}.json: source, year, level, depth, id, name, name_id, amount, parent_id
+    year_totals     per source and year: amount and the sheet's own 合計 (sheet_total)
+    crosstab        data/unified/crosstab_*.npz as source, year, agency, category, amount
+    names, name_aliases                             docs/specs/v2.0.0/name_registry.json
+Materialized (rebuilt with the file):
+    kuan_totals     Kuan nodes with their share of the year total
+    kuan_yoy        (view) kuan_totals with the previous year's amount, matched on name_id
+
+    python scripts/export_db.py                       # data/unified/budget.sqlite
+    python scripts/export_db.py --engine duckdb       # data/unified/budget.duckdb (needs `pip install duckdb`)
+    sqlite3 data/unified/budget.sqlite "SELECT year, name, amount FROM kuan_totals WHERE source = 'function'"
+"""
+
+import os
+import sys
+import json
+import sqlite3
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from transform_crosstab import CrossTab
+from name_registry import REGISTRY_FILE
+
+JSON_DIR = "data/json"
+UNIFIED_DIR = "data/unified"
+LEVEL_TABLES = {
+    "revenue": "revenue_by_source.json",
+    "function": "expenditure_by_function.json",
+    "agency": "expenditure_by_agency.json",
+}
+CSV_TABLES = {"budget": "budget_all.csv", "funds": "funds_all.csv", "summary": "summary_all.csv"}
+LEVELS = ["Kuan", "Xiang", "Mu", "Jie"]
+
+# (table, columns) per index; the year/level/parent/name lookups analysts filter and join on
+INDEXES = [
+    ("budget", ["year", "type"]),
+    ("budget", ["category_1"]),
+    ("budget", ["category_2"]),
+    ("budget", ["item_name"]),
+    ("funds", ["year"]),
+    ("funds", ["fund_name"]),
+    ("summary", ["year"]),
+    ("summary_categories", ["year", "kind"]),
+    ("nodes", ["source", "year", "level"]),
+    ("nodes", ["source", "year", "parent_id"]),
+    ("nodes", ["source", "id"]),
+    ("nodes", ["name"]),
+    ("nodes", ["name_id"]),
+    ("crosstab", ["source", "year"]),
+    ("crosstab", ["agency"]),
+    ("crosstab", ["category"]),
+    ("name_aliases", ["alias"]),
+    ("kuan_totals", ["source", "year"]),
+    ("kuan_totals", ["name_id"]),
+]
+
+MATERIALIZED = {
+    "kuan_totals": """
+        SELECT n.source, n.year, n.id, n.name, n.name_id, n.amount,
+               CAST(n.amount AS DOUBLE) / t.amount AS share
+        FROM nodes n JOIN year_totals t ON t.source = n.source AND t.year = n.year
+        WHERE n.level = 'Kuan'
+    """,
+}
+VIEWS = {
+    "kuan_yoy": """
+        SELECT source, year, id, name, name_id, amount,
+               LAG(amount) OVER (PARTITION BY source, name_id ORDER BY year) AS prev_amount,
+               LAG(year) OVER (PARTITION BY source, name_id ORDER BY year) AS prev_year
+        FROM kuan_totals
+    """,
+}
+
+
+def load_json(path):
+    if not os.path.exists(path):
+        print(f"Skipping {path} (not found)")
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def level_frames(source, years):
+    """(nodes, year_totals) frames of one level table."""
+    frames = []
+    for year_data in years:
+        for depth, level in enumerate(LEVELS):
+            nodes = year_data.get(level, [])
+            if nodes:
+                frames.append(pd.DataFrame(nodes).assign(source=source, year=year_data["year"], level=level, depth=depth))
+    nodes = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    if "name_id" not in nodes:
+        nodes["name_id"] = None
+    totals = pd.DataFrame([{"source": source, "year": y["year"], "amount": y["amount"],
+                            "sheet_total": y.get("sheet_total")} for y in years])
+    return nodes[["source", "year", "level", "depth", "id", "name", "name_id", "amount", "parent_id"]], totals
+
+def summary_frames(summary):
+    totals = pd.DataFrame([{"year": y["year"], "revenue": y["revenue"], "expenditure": y["expenditure"]}
+                           for y in summary])
+    categories = pd.DataFrame([{"year": y["year"], "kind": kind, "name": cat["name"], "amount": cat["amount"]}
+                               for y in summary for kind in ["revenue", "expenditure"]
+                               for cat in y[f"{kind}_categories"]])
+    return totals, categories
+
+def crosstab_frame(source, tab):
+    return pd.DataFrame({"source": source, "year": tab.years.astype(np.int64),
+                         "agency": np.array(tab.agencies, dtype=object)[tab.agency],
+                         "category": np.array(tab.categories, dtype=object)[tab.category],
+                         "amount": tab.amount})
+
+def registry_frames(doc):
+    names = pd.DataFrame([{"name_id": e["id"], "name": e["name"],
+                           "first_year": (e.get("years") or [None, None])[0],
+                           "last_year": (e.get("years") or [None, None])[1]} for e in doc["entities"]])
+    aliases = pd.DataFrame([{"alias": a, "name_id": e["id"]} for e in doc["entities"] for a in e["aliases"]])
+    return names, aliases
+
+def collect_tables(json_dir, unified_dir, registry_path):
+    """{table name: DataFrame} for every input that exists."""
+    tables = {}
+    for name, filename in CSV_TABLES.items():
+        path = os.path.join(unified_dir, filename)
+        if os.path.exists(path):
+            # Text columns stay text (ids and names with leading zeros or digits only)
+            tables[name] = pd.read_csv(path, dtype={"source_file": str}, keep_default_na=False, na_values=[""])
+        else:
+            print(f"Skipping {path} (not found)")
+
+    summary = load_json(os.path.join(json_dir, "summary.json"))
+    if summary:
+        tables["summary_totals"], tables["summary_categories"] = summary_frames(summary)
+
+    nodes, totals = [], []
+    for source, filename in LEVEL_TABLES.items():
+        years = load_json(os.path.join(json_dir, filename))
+        if years:
+            n, t = level_frames(source, years)
+            nodes.append(n)
+            totals.append(t)
+    if nodes:
+        tables["nodes"] = pd.concat(nodes, ignore_index=True)
+        tables["year_totals"] = pd.concat(totals, ignore_index=True)
+
+    crosstabs = []
+    for source in ["agency_function", "agency_source"]:
+        path = os.path.join(unified_dir, f"crosstab_{source}.npz")
+        if os.path.exists(path):
+            crosstabs.append(crosstab_frame(source, CrossTab.load(path)))
+    if crosstabs:
+        tables["crosstab"] = pd.concat(crosstabs, ignore_index=True)
+
+    if os.path.exists(registry_path):
+        with open(registry_path, encoding='utf-8') as f:
+            tables["names"], tables["name_aliases"] = registry_frames(json.load(f))
+    return tables
+
+def connect(engine, path):
+    if engine == "duckdb":
+        import duckdb
+        return duckdb.connect(path)
+    con = sqlite3.connect(path)
+    # A fresh file that is rebuilt from scratch: no journal or fsync needed during the load
+    con.execute("PRAGMA journal_mode = OFF")
+    con.execute("PRAGMA synchronous = OFF")
+    return con
+
+def write_table(con, engine, name, df):
+    if engine == "duckdb":
+        con.register("frame", df)
+        con.execute(f"CREATE TABLE {name} AS SELECT * FROM frame")
+        con.unregister("frame")
+    else:
+        df.to_sql(name, con, index=False, chunksize=50000)
+
+def build_database(tables, engine, path):
+    """Write tables, indexes, materialized tables and views to a new file at path (replaced atomically)."""
+    tmp = path + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    con = connect(engine, tmp)
+    try:
+        for name, df in tables.items():
+            write_table(con, engine, name, df)
+        if "nodes" in tables:
+            for name, query in MATERIALIZED.items():
+                con.execute(f"CREATE TABLE {name} AS {query}")
+            for name, query in VIEWS.items():
+                con.execute(f"CREATE VIEW {name} AS {query}")
+        created = set(tables) | (set(MATERIALIZED) if "nodes" in tables else set())
+        for table, columns in INDEXES:
+            if table in created:
+                con.execute(f"CREATE INDEX idx_{table}_{'_'.join(columns)} ON {table} ({', '.join(columns)})")
+        if engine == "sqlite":
+            # Planner statistics, so the indexes are actually picked
+            con.execute("ANALYZE")
+            con.commit()
+    finally:
+        con.close()
+    os.replace(tmp, path)
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the pipeline outputs into one indexed SQLite/DuckDB file")
+    parser.add_argument("--engine", choices=["sqlite", "duckdb"], default="sqlite",
+                        help="sqlite (stdlib, default) or duckdb (optional dependency)")
+    parser.add_argument("--output", help=f"Database file (default: {UNIFIED_DIR}/budget.sqlite or .duckdb)")
+    parser.add_argument("--json-dir", default=JSON_DIR, help=f"Transform outputs directory (default: {JSON_DIR})")
+    parser.add_argument("--unified-dir", default=UNIFIED_DIR, help=f"ETL outputs directory (default: {UNIFIED_DIR})")
+    parser.add_argument("--registry", default=REGISTRY_FILE, help=f"Name registry (default: {REGISTRY_FILE})")
+    args = parser.parse_args()
+
+    engine = args.engine
+    if engine == "duckdb":
+        try:
+            import duckdb # noqa: F401  (optional dependency, only needed for --engine duckdb)
+        except ImportError:
+            print("duckdb is not installed (pip install duckdb); writing SQLite instead.")
+            engine = "sqlite"
+    path = args.output or os.path.join(UNIFIED_DIR, "budget.sqlite" if engine == "sqlite" else "budget.duckdb")
+
+    tables = collect_tables(args.json_dir, args.unified_dir, args.registry)
+    if not tables:
+        print("No pipeline outputs found; run etl_budget.py and the transform_*.py scripts first.")
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    build_database(tables, engine, path)
+    for name, df in tables.items():
+        print(f"  {name:<20} {len(df):8d} rows")
+    print(f"Generated {path} ({os.path.getsize(path) / 1024 / 1024:.1f} MB, {engine}).")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Canonical names with stable integer ids, shared by the transforms so that cross-year joins
+compare ids instead of re-matching strings.
+
+An id identifies a canonical name, not a budget entity: unrelated nodes that happen to share
+a name (一般行政 under nearly every agency, 非營業特種基金 under several ministries) share one
+id, so anything tracking a node across years keys on the id together with its parent path.
+
+The same item is spelled differently across years: full-width vs ASCII punctuation
+(擴（遷）建 / 擴(遷)建), 台 vs 臺, stray spaces, a code prefix ("0101000000 稅課收入"), or
+an agency renamed outright (國家科學委員會 -> 科技部 -> 國家科學及技術委員會). normalize_name
+folds the spelling differences, RENAMES the renames, and every raw spelling that was ever
+seen is kept as an alias of its entity, so later lookups of it are one dict hit.
+
+The registry is reference data committed at docs/specs/v2.0.0/name_registry.json. The
+transforms only read it (a name it does not know gets id -1 and a warning), so their output
+does not depend on which of them ran first. Only `--update` writes it, and it only ever
+grows: existing ids are kept, and new names are numbered in (first year, canonical name)
+order over all outputs at once, so the same outputs always give the same ids. Aliases added
+to that file by hand are honoured on the next run, which is how two spellings the rules do
+not fold are merged.
+
+    python scripts/name_registry.py --update     # register the names of all transform outputs
+    python scripts/name_registry.py              # only report the names the registry lacks
+"""
+
+import os
+import re
+import json
+import argparse
+import unicodedata
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+REGISTRY_FILE = os.path.join("docs", "specs", "v2.0.0", "name_registry.json")
+FORMAT = "name-registry-1"
+# Sort key of names seen without a year (after every real year)
+UNDATED = 10 ** 4
+
+# A code only counts as a prefix when separated from the name, so "5G…" or "921…" stay whole
+CODE_PREFIX_RE = re.compile(r"^\d+[\s.、]+(?=\D)")
+WHITESPACE_RE = re.compile(r"\s+")
+AGENCY_SUFFIX = "主管"
+# Agencies renamed by the government reorganizations; old name -> current name
+RENAMES = {
+    "行政院文化建設委員會": "文化部",
+    "文化建設委員會": "文化部",
+    "行政院衛生署": "衛生福利部",
+    "衛生署": "衛生福利部",
+    "行政院勞工委員會": "勞動部",
+    "勞工委員會": "勞動部",
+    "行政院國家科學委員會": "國家科學及技術委員會",
+    "國家科學委員會": "國家科學及技術委員會",
+    "科技部": "國家科學及技術委員會",
+    "行政院農業委員會": "農業部",
+    "農業委員會": "農業部",
+    "行政院環境保護署": "環境部",
+    "環境保護署": "環境部",
+    "行政院原子能委員會": "核能安全委員會",
+    "原子能委員會": "核能安全委員會",
+    "行政院主計處": "行政院主計總處",
+    "行政院人事行政局": "行政院人事行政總處",
+}
+
+
+@lru_cache(maxsize=None)
+def normalize_name(name):
+    """Spelling-insensitive form of a name: NFKC, no whitespace, no leading code, 台 -> 臺."""
+    s = CODE_PREFIX_RE.sub("", unicodedata.normalize("NFKC", name).strip())
+    return WHITESPACE_RE.sub("", s).replace("台", "臺")
+
+@lru_cache(maxsize=None)
+def canonical_name(name):
+    """normalize_name plus RENAMES, also under the 主管 suffix of the agency-group rows."""
+    s = normalize_name(name)
+    if s.endswith(AGENCY_SUFFIX):
+        stem = s[:-len(AGENCY_SUFFIX)]
+        return RENAMES.get(stem, stem) + AGENCY_SUFFIX
+    return RENAMES.get(s, s)
+
+
+class NameRegistry:
+    """
+    Canonical name <-> id, plus every raw spelling seen (alias -> id) and the years it spans.
+    Read-only unless created with update=True: unknown names then map to -1 and are collected
+    in `missing` instead of being registered.
+    """
+
+    def __init__(self, path=None, update=False):
+        self.path = path
+        self.update = update
+        self.missing = set()
+        self.names = []
+        self.years = []
+        self._ids = {}
+        self._aliases = {}
+        self._alias_lists = []
+
+    @classmethod
+    def load(cls, path=REGISTRY_FILE, update=False):
+        """The registry saved at path, or an empty one (that --update will save there)."""
+        registry = cls(path, update)
+        if not os.path.exists(path):
+            return registry
+        with open(path, encoding='utf-8') as f:
+            doc = json.load(f)
+        for entity in sorted(doc["entities"], key=lambda e: e["id"]):
+            if entity["id"] != len(registry.names):
+                raise ValueError(f"{path}: entity ids must be 0..n-1 without gaps (got {entity['id']})")
+            i = registry._add(entity["name"], entity.get("years"))
+            for alias in entity.get("aliases", []):
+                registry._aliases[alias] = i
+                # A hand-added alias also claims its canonical form, unless another entity has it
+                registry._ids.setdefault(canonical_name(alias), i)
+                registry._alias_lists[i].append(alias)
+        return registry
+
+    def __len__(self):
+        return len(self.names)
+
+    def _add(self, name, years=None):
+        i = len(self.names)
+        self.names.append(name)
+        self.years.append(list(years) if years else None)
+        self._alias_lists.append([])
+        self._ids[name] = i
+        return i
+
+    def id(self, name, year=None):
+        """Id of a raw name; in update mode, registering it (and its canonical entity) on first sight."""
+        i = self._aliases.get(name)
+        if i is None:
+            key = canonical_name(name)
+            i = self._ids.get(key)
+            if not self.update:
+                if i is None:
+                    self.missing.add(name)
+                    return -1
+                # A new spelling of a known name: cached for this run, recorded by --update
+                self._aliases[name] = i
+                return i
+            if i is None:
+                i = self._add(key)
+            self._aliases[name] = i
+            self._alias_lists[i].append(name)
+        if year is not None and self.update:
+            span = self.years[i]
+            if span is None:
+                self.years[i] = [year, year]
+            elif not span[0] <= year <= span[1]:
+                self.years[i] = [min(span[0], year), max(span[1], year)]
+        return i
+
+    def ids(self, values, year=None):
+        """int32 ids for an array-like of names, resolving each distinct name once (missing/"" -> -1)."""
+        local, uniques = pd.factorize(np.asarray(values, dtype=object))
+        mapping = np.array([self.id(s, year) if s else -1 for s in uniques] + [-1], dtype=np.int32)
+        return mapping[local]
+
+    def aliases(self, i):
+        return list(self._alias_lists[i])
+
+    def warn_missing(self):
+        """Print the names looked up but not registered (their id is -1), if any."""
+        if self.missing:
+            sample = ", ".join(sorted(self.missing)[:5]) + (", ..." if len(self.missing) > 5 else "")
+            print(f"Warning: {len(self.missing)} names are not in {self.path} and got name_id -1 ({sample}); "
+                  f"run `python scripts/name_registry.py --update` and rebuild.")
+
+    def save(self, path=None):
+        if not self.update:
+            raise RuntimeError("NameRegistry.save() needs a registry loaded with update=True")
+        path = path or self.path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        entities = [{"id": i, "name": name, "years": self.years[i], "aliases": self._alias_lists[i]}
+                    for i, name in enumerate(self.names)]
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"format": FORMAT, "entities": entities}, f, ensure_ascii=False, indent=1)
+        return path
+
+
+def _level_names(path):
+    """(year, name) of every node of a transform_* level table (data/json/*_by_*.json)."""
+    with open(path, encoding='utf-8') as f:
+        for year_data in json.load(f):
+            for level in ["Kuan", "Xiang", "Mu", "Jie"]:
+                for node in year_data.get(level, []):
+                    yield year_data["year"], node["name"]
+
+def _summary_names(path):
+    """(year, name) of every revenue / expenditure category of summary.json (transform_summary.py)."""
+    with open(path, encoding='utf-8') as f:
+        for year_data in json.load(f):
+            for kind in ["revenue", "expenditure"]:
+                for cat in year_data.get(f"{kind}_categories", []):
+                    yield year_data["year"], cat["name"]
+
+def _crosstab_names(path):
+    """
+    (year, name) of every agency and category with a cell in a transform_crosstab .npz, and
+    (None, name) of the dictionary entries whose amounts are all zero (they still get an id).
+    """
+    with np.load(path) as z:
+        year, agency, category = z["year"], z["agency"], z["category"]
+        agencies, categories = z["agencies"].tolist(), z["categories"].tolist()
+    for codes, names in ((agency, agencies), (category, categories)):
+        pairs = sorted(set(zip(year.tolist(), codes.tolist())))
+        for y, c in pairs:
+            yield y, names[c]
+        seen = {c for _, c in pairs}
+        for c, name in enumerate(names):
+            if c not in seen:
+                yield None, name
+
+def main():
+    parser = argparse.ArgumentParser(description=f"Register every name of the transform outputs in {REGISTRY_FILE}")
+    parser.add_argument("--json-dir", default="data/json")
+    parser.add_argument("--unified-dir", default="data/unified")
+    parser.add_argument("--registry", default=REGISTRY_FILE)
+    parser.add_argument("--update", action="store_true",
+                        help="Add the new names and spellings to the registry file (otherwise only report them)")
+    args = parser.parse_args()
+
+    registry = NameRegistry.load(args.registry, update=True)
+    before = len(registry)
+    sources = []
+    for name in ["revenue_by_source.json", "expenditure_by_function.json", "expenditure_by_agency.json"]:
+        sources.append((os.path.join(args.json_dir, name), _level_names))
+    # build_aggregates keys the summary categories on their ids too
+    sources.append((os.path.join(args.json_dir, "summary.json"), _summary_names))
+    for name in ["crosstab_agency_function.npz", "crosstab_agency_source.npz"]:
+        sources.append((os.path.join(args.unified_dir, name), _crosstab_names))
+
+    pairs = set()
+    for path, reader in sources:
+        if not os.path.exists(path):
+            print(f"Skipping {path} (not found)")
+            continue
+        found = set(reader(path))
+        pairs |= found
+        print(f"Read {len({n for _, n in found})} names from {path}")
+
+    # All sources in one pass, new entities in (first year, canonical name) order, so the ids
+    # do not depend on which outputs exist on disk in which order; undated names go last
+    def year_key(year):
+        return UNDATED if year is None else year
+    first_year = {}
+    for year, name in pairs:
+        key = canonical_name(name)
+        first_year[key] = min(year_key(year), first_year.get(key, UNDATED))
+    for year, name in sorted(pairs, key=lambda p: (first_year[canonical_name(p[1])], canonical_name(p[1]),
+                                                   year_key(p[0]), p[1])):
+        registry.id(name, year)
+
+    added = len(registry) - before
+    merged = sum(1 for i in range(len(registry)) if len(registry.aliases(i)) > 1)
+    if not args.update:
+        print(f"{args.registry}: {len(registry)} entities, {added} new names found; re-run with --update to add them.")
+        return
+    registry.save()
+    print(f"Wrote {args.registry}: {len(registry)} entities ({added} new), {merged} with more than one spelling.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Local read-only HTTP/JSON query service over the ETL outputs
+(data/json/*_by_*.json level tables and data/unified/*.csv).
+Every file is loaded and indexed once at startup (by year, by 2-2-2-4 id prefix, by name),
+and each distinct query is answered from an LRU response cache after its first hit.
+
+    python scripts/query_service.py --port 8765
+    curl 'localhost:8765/budget?year=2025&type=Expenditure'
+    curl 'localhost:8765/subtree?table=agency&year=2025&id=0100000000'
+    curl 'localhost:8765/funds/top?year=2025&n=10&by=expense'
+    curl 'localhost:8765/timeseries?table=agency&name=%E5%9C%8B%E9%98%B2%E9%83%A8%E4%B8%BB%E7%AE%A1'  # 國防部主管
+"""
+
+import os
+import json
+import bisect
+import argparse
+import functools
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qsl
+import pandas as pd
+
+JSON_DIR = "data/json"
+UNIFIED_DIR = "data/unified"
+LEVEL_TABLES = {
+    "revenue": "revenue_by_source.json",
+    "function": "expenditure_by_function.json",
+    "agency": "expenditure_by_agency.json",
+}
+LEVELS = ["Kuan", "Xiang", "Mu", "Jie"]
+# Significant digits of a 2-2-2-4 id at each level; a node's whole subtree shares this prefix
+PREFIX_WIDTHS = {"Kuan": 2, "Xiang": 4, "Mu": 6, "Jie": 10}
+FUND_METRICS = ["income", "expense", "surplus"]
+
+
+class QueryError(ValueError):
+    """Bad or missing query parameter (HTTP 400), or a year / node that does not exist (404)."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _int_param(query, key, default=None, minimum=None):
+    value = query.get(key, default)
+    if value is None:
+        raise QueryError(f"missing parameter: {key}")
+    try:
+        value = int(value)
+    except ValueError:
+        raise QueryError(f"{key} must be an integer, got {value!r}")
+    if minimum is not None and value < minimum:
+        raise QueryError(f"{key} must be at least {minimum}, got {value}")
+    return value
+
+def _param(query, key, choices=None, default=None):
+    value = query.get(key, default)
+    if value is None:
+        raise QueryError(f"missing parameter: {key}")
+    if choices is not None and value not in choices:
+        raise QueryError(f"{key} must be one of {sorted(choices)}")
+    return value
+
+
+class BudgetIndex:
+    """In-memory indexes over whichever ETL outputs exist; missing files just disable their queries."""
+
+    def __init__(self, json_dir=JSON_DIR, unified_dir=UNIFIED_DIR):
+        # table -> year -> (sorted ids, nodes in the same order, {id: node})
+        self.levels = {}
+        # table -> name -> [(year, record)] in year order
+        self.names = {}
+        for table, filename in LEVEL_TABLES.items():
+            path = os.path.join(json_dir, filename)
+            if os.path.exists(path):
+                with open(path, encoding='utf-8') as f:
+                    self._index_levels(table, json.load(f))
+
+        self.budget = self._read_csv(unified_dir, "budget_all.csv")
+        if self.budget is not None:
+            # (year, type, category_1) -> row positions, and the category totals per (year, type)
+            self.budget_groups = self.budget.groupby(["year", "type", "category_1"], sort=False).indices
+            totals = self.budget.groupby(["year", "type", "category_1"], sort=False)["amount"].sum()
+            self.category_totals = {}
+            for (year, budget_type, category), amount in totals.items():
+                self.category_totals.setdefault((year, budget_type), []).append({"category": category, "amount": int(amount)})
+            for rows in self.category_totals.values():
+                rows.sort(key=lambda r: -r["amount"])
+
+        funds = self._read_csv(unified_dir, "funds_all.csv")
+        self.funds = {}
+        if funds is not None:
+            for year, rows in funds.drop(columns=["source_file"]).groupby("year"):
+                records = rows.to_dict("records")
+                # Pre-sorted per metric, so top-N is a slice
+                self.funds[year] = {m: sorted(records, key=lambda r: -r[m]) for m in FUND_METRICS}
+            self.names["funds"] = self._by_name(funds, "fund_name")
+
+        summary = self._read_csv(unified_dir, "summary_all.csv")
+        if summary is not None:
+            self.names["summary"] = self._by_name(summary, "category")
+
+    @staticmethod
+    def _read_csv(unified_dir, filename):
+        path = os.path.join(unified_dir, filename)
+        if not os.path.exists(path):
+            return None
+        # Blank hierarchy cells stay "" rather than NaN, as the ETL wrote them
+        return pd.read_csv(path, keep_default_na=False)
+
+    @staticmethod
+    def _by_name(df, name_col):
+        index = {}
+        for record in df.drop(columns=["source_file"]).to_dict("records"):
+            index.setdefault(record[name_col], []).append((record["year"], record))
+        return index
+
+    def _index_levels(self, table, years):
+        by_year = {}
+        names = {}
+        for year_data in years:
+            nodes = []
+            for level in LEVELS:
+                for node in year_data.get(level, []):
+                    node = dict(node, level=level)
+                    nodes.append(node)
+                    names.setdefault(node["name"], []).append((year_data["year"], node))
+            nodes.sort(key=lambda n: n["id"])
+            by_year[year_data["year"]] = ([n["id"] for n in nodes], nodes, {n["id"]: n for n in nodes})
+        self.levels[table] = by_year
+        self.names[table] = names
+
+    # --- Queries ---
+
+    def years(self):
+        out = {table: sorted(by_year) for table, by_year in self.levels.items()}
+        if self.budget is not None:
+            out["budget"] = sorted(self.budget["year"].unique().tolist())
+        out["funds"] = sorted(self.funds)
+        return out
+
+    def budget_categories(self, year, budget_type, category=None):
+        """Category totals of one year × type, or the line items of one category."""
+        if self.budget is None:
+            raise QueryError("data/unified/budget_all.csv not found; run etl_budget.py")
+        if category is None:
+            return self.category_totals.get((year, budget_type), [])
+        rows = self.budget_groups.get((year, budget_type, category))
+        if rows is None:
+            return []
+        return self.budget.iloc[rows].drop(columns=["year", "type", "category_1"]).to_dict("records")
+
+    def subtree(self, table, year, node_id):
+        """
+        The node with this id (or id prefix) and everything below it, in id order.
+        A full id is cut to its level's prefix, so '0101000000' (a Xiang) matches '0101*'.
+        """
+        if year not in self.levels[table]:
+            raise QueryError(f"no {table} data for year {year}", 404)
+        ids, nodes, by_id = self.levels[table][year]
+        node = by_id.get(node_id)
+        prefix = node_id[:PREFIX_WIDTHS[node["level"]]] if node else node_id
+        # ids are digit strings, and ':' sorts right after '9'
+        lo = bisect.bisect_left(ids, prefix)
+        hi = bisect.bisect_left(ids, prefix + ":")
+        if lo == hi:
+            raise QueryError(f"no {table} node with id {node_id!r} in {year}", 404)
+        return {"node": node, "descendants": [n for n in nodes[lo:hi] if n is not node]}
+
+    def top_funds(self, year, n, metric):
+        return self.funds.get(year, {}).get(metric, [])[:n]
+
+    def timeseries(self, table, name):
+        return [dict(record, year=year) for year, record in self.names[table].get(name, [])]
+
+
+class QueryService:
+    """Routes GET paths to BudgetIndex queries; responses are JSON bytes cached per (path, query)."""
+
+    def __init__(self, index, cache_size=1024):
+        self.index = index
+        self.routes = {
+            "/years": lambda q: index.years(),
+            "/budget": lambda q: index.budget_categories(
+                _int_param(q, "year"), _param(q, "type", {"Expenditure", "Revenue"}), q.get("category")),
+            "/subtree": lambda q: index.subtree(
+                _param(q, "table", index.levels), _int_param(q, "year"), _param(q, "id")),
+            "/funds/top": lambda q: index.top_funds(
+                _int_param(q, "year"), _int_param(q, "n", 10, minimum=1), _param(q, "by", FUND_METRICS, "expense")),
+            "/timeseries": lambda q: index.timeseries(_param(q, "table", index.names), _param(q, "name")),
+        }
+        self.answer = functools.lru_cache(maxsize=cache_size)(self._answer)
+
+    def _answer(self, path, query):
+        """(HTTP status, JSON body) for one request; query is a sorted tuple so it can be a cache key."""
+        route = self.routes.get(path)
+        if route is None:
+            return 404, self._encode({"error": f"unknown path {path}", "paths": sorted(self.routes)})
+        try:
+            return 200, self._encode({"data": route(dict(query))})
+        except QueryError as e:
+            return e.status, self._encode({"error": str(e)})
+
+    @staticmethod
+    def _encode(payload):
+        # numpy scalars from pandas rows become plain ints/floats
+        return json.dumps(payload, ensure_ascii=False, default=lambda o: o.item()).encode("utf-8")
+
+    def handler(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                status, body = service.answer(url.path.rstrip("/") or "/", tuple(sorted(parse_qsl(url.query))))
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve indexed queries over the ETL outputs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--json-dir", default=JSON_DIR, help=f"Level tables directory (default: {JSON_DIR})")
+    parser.add_argument("--unified-dir", default=UNIFIED_DIR, help=f"Unified CSV directory (default: {UNIFIED_DIR})")
+    parser.add_argument("--cache-size", type=int, default=1024, help="Cached responses (default: 1024)")
+    args = parser.parse_args()
+
+    index = BudgetIndex(args.json_dir, args.unified_dir)
+    service = QueryService(index, args.cache_size)
+    print(f"Indexed years: {index.years()}")
+    server = ThreadingHTTPServer((args.host, args.port), service.handler())
+    print(f"Serving on http://{args.host}:{args.port} ({', '.join(sorted(service.routes))})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+if __name__ == "__main__":
+    main()
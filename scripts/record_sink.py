@@ -0,0 +1,130 @@
+"""
+Chunked writers for record streams, so the ETL can emit rows year by year
+without holding the whole dataset in memory.
+"""
+import os
+import json
+import pandas as pd
+
+def jsonl_text(df):
+    """
+    df as JSON lines, one record per line. The batch writers use it too, so a streamed
+    .jsonl is byte-identical to the batch one (pandas separators and escaping, trailing newline).
+    """
+    text = df.to_json(orient="records", lines=True, force_ascii=False)
+    return text if text.endswith("\n") else text + "\n"
+
+class RecordSink:
+    """
+    Appends record dicts to one output and flushes every `chunk_size` records.
+    fmt: "csv", "jsonl", "json" (a single array, formatted like json.dump(indent=2)) or
+    "parquet" (requires pyarrow; with partition_col, a <col>=<value>/part-N.parquet dataset).
+    The output is only created once the first record arrives, matching the
+    "write nothing for an empty table" behaviour of the batch writers; a "json"
+    sink with no records still writes "[]", as json.dump would.
+    """
+
+    def __init__(self, path, fmt, chunk_size=50000, categorical_cols=(), int_cols=(), partition_col=None):
+        self.path = path
+        self.fmt = fmt
+        self.chunk_size = chunk_size
+        self.categorical_cols = list(categorical_cols)
+        self.int_cols = list(int_cols)
+        self.partition_col = partition_col
+        self.count = 0
+        self._buffer = []
+        self._file = None
+        self._parquet_writer = None
+        self._parts = 0
+        self._closed = False
+
+    def write(self, records):
+        for record in records:
+            self._buffer.append(record)
+            if len(self._buffer) >= self.chunk_size:
+                self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        chunk, self._buffer = self._buffer, []
+        if self.fmt == "csv":
+            self._write_csv(chunk)
+        elif self.fmt == "jsonl":
+            self._open("w")
+            self._file.write(jsonl_text(pd.DataFrame(chunk)))
+        elif self.fmt == "json":
+            self._write_json(chunk)
+        elif self.fmt == "parquet":
+            self._write_parquet(chunk)
+        else:
+            raise ValueError(f"Unknown sink format: {self.fmt}")
+        self.count += len(chunk)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.flush()
+        if self.fmt == "json":
+            if self._open("w"):
+                self._file.write("[]")
+            else:
+                self._file.write("\n]")
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _open(self, mode):
+        if self._file is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._file = open(self.path, mode, encoding='utf-8', newline='')
+            return True
+        return False
+
+    def _write_csv(self, chunk):
+        first = self._open("w")
+        pd.DataFrame(chunk).to_csv(self._file, header=first, index=False)
+
+    def _write_json(self, chunk):
+        # Each element is indented one level, exactly as json.dump(list, indent=2) lays it out
+        first = self._open("w")
+        parts = ["  " + json.dumps(record, ensure_ascii=False, indent=2).replace("\n", "\n  ") for record in chunk]
+        self._file.write(("[\n" if first else ",\n") + ",\n".join(parts))
+
+    def _frame(self, chunk, categorical=True):
+        df = pd.DataFrame(chunk)
+        if categorical:
+            df = df.astype({col: "category" for col in self.categorical_cols if col in df})
+        return df.astype({col: "int64" for col in self.int_cols if col in df})
+
+    def _write_parquet(self, chunk):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self.partition_col:
+            df = self._frame(chunk)
+            for value, part in df.groupby(self.partition_col, sort=False, observed=True):
+                part_dir = os.path.join(self.path, f"{self.partition_col}={value}")
+                os.makedirs(part_dir, exist_ok=True)
+                part.drop(columns=[self.partition_col]).to_parquet(
+                    os.path.join(part_dir, f"part-{self._parts}.parquet"), engine="pyarrow", index=False)
+                self._parts += 1
+            return
+
+        # One file across chunks needs a stable schema, so text stays plain strings here;
+        # Parquet still dictionary-encodes them on disk
+        table = pa.Table.from_pandas(self._frame(chunk, categorical=False), preserve_index=False)
+        if self._parquet_writer is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._parquet_writer = pq.ParquetWriter(self.path, table.schema)
+        self._parquet_writer.write_table(table.cast(self._parquet_writer.schema))
@@ -0,0 +1,134 @@
+"""
+Compact in-memory tables for ETL records.
+A budget line repeats the same few strings (source file, 款/項 names) on thousands of rows, so
+text fields are interned once in a StringTable and every column is a flat array: an int32 code
+per text cell, an int64 per number. Records only become dicts / DataFrames at the output edge.
+"""
+from array import array
+import numpy as np
+import pandas as pd
+
+# Field kinds: "str" cells are interned (None allowed), "int" cells are int64
+STR = "str"
+INT = "int"
+
+
+class StringTable:
+    """Interned strings: each distinct string is stored once and referred to by its index."""
+
+    def __init__(self):
+        self.strings = []
+        self._index = {}
+
+    def code(self, s):
+        """Index of s, adding it on first sight; None maps to -1."""
+        if s is None:
+            return -1
+        idx = self._index.get(s)
+        if idx is None:
+            idx = len(self.strings)
+            self._index[s] = idx
+            self.strings.append(s)
+        return idx
+
+    def codes(self, values):
+        """Codes for an array-like of strings (NaN/None -> -1), interning each distinct value once."""
+        local, uniques = pd.factorize(np.asarray(values, dtype=object))
+        # factorize marks missing values as -1, which picks the trailing -1 of the mapping
+        mapping = np.array([self.code(s) for s in uniques] + [-1], dtype=np.int32)
+        return mapping[local]
+
+    def decode(self, codes):
+        """Object array of the strings for the given codes (-1 -> None)."""
+        lookup = np.array(self.strings + [None], dtype=object)
+        return lookup[np.asarray(codes, dtype=np.int64)]
+
+    def __len__(self):
+        return len(self.strings)
+
+    # The reverse index is rebuilt after unpickling, so pool results and cache files only carry the list
+    def __getstate__(self):
+        return self.strings
+
+    def __setstate__(self, strings):
+        self.strings = strings
+        self._index = {s: i for i, s in enumerate(strings)}
+
+
+class RecordStore:
+    """
+    Column-oriented replacement for a list of record dicts with a fixed schema.
+    fields: {name: STR | INT} in output column order. Stores built for the same output can
+    share one StringTable (strings=) so names repeated across them are kept once.
+    Iterating yields plain dicts, so it can be passed wherever a list of records was.
+    """
+
+    def __init__(self, fields, strings=None):
+        self.fields = dict(fields)
+        self.strings = strings if strings is not None else StringTable()
+        self.columns = {name: array('i' if kind == STR else 'q') for name, kind in self.fields.items()}
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def append(self, record):
+        for name, kind in self.fields.items():
+            value = record[name]
+            self.columns[name].append(self.strings.code(value) if kind == STR else value)
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def extend_frame(self, df):
+        """Append the rows of a DataFrame holding (at least) every field, one column at a time."""
+        for name, kind in self.fields.items():
+            if kind == STR:
+                values = self.strings.codes(df[name]).astype(np.int32)
+            else:
+                values = np.asarray(df[name], dtype=np.int64)
+            self.columns[name].frombytes(values.tobytes())
+
+    def extend_store(self, other):
+        """Append another store with the same fields, re-coding its strings into this table."""
+        for name, kind in self.fields.items():
+            values = other.columns[name]
+            if kind == STR and other.strings is not self.strings:
+                mapping = np.array([self.strings.code(s) for s in other.strings.strings] + [-1], dtype=np.int32)
+                values = mapping[np.frombuffer(values, dtype=np.int32)]
+            self.columns[name].frombytes(bytes(values))
+
+    def add_column(self, name, kind, values):
+        """Add a field after the existing ones, filled from an array-like with one value per record."""
+        if len(values) != len(self):
+            raise ValueError(f"{name}: {len(values)} values for {len(self)} records")
+        self.fields[name] = kind
+        self.columns[name] = array('i' if kind == STR else 'q')
+        if kind == STR:
+            values = self.strings.codes(values)
+        self.columns[name].frombytes(np.asarray(values, dtype=np.int32 if kind == STR else np.int64).tobytes())
+
+    def column(self, name):
+        """One field as a numpy array (object array of strings for STR fields)."""
+        if self.fields[name] == STR:
+            return self.strings.decode(np.frombuffer(self.columns[name], dtype=np.int32))
+        # Copy so no numpy view pins the array buffer (array.array cannot grow while exported)
+        return np.frombuffer(self.columns[name], dtype=np.int64).copy()
+
+    def to_frame(self):
+        return pd.DataFrame({name: self.column(name) for name in self.fields})
+
+    def __iter__(self):
+        names = list(self.fields)
+        for values in zip(*(self.column(name).tolist() for name in names)):
+            yield dict(zip(names, values))
+
+    def to_records(self):
+        return list(self)
+
+
+def encode_records(obj):
+    """json.dump(default=encode_records): writes a RecordStore as the list of dicts it stands for."""
+    if isinstance(obj, RecordStore):
+        return obj.to_records()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
@@ -0,0 +1,92 @@
+"""
+Derive scaled views (thousand / million / billion) from one canonical integer dataset.
+Amounts in every output are integer NT$ thousand (千元), as in the source workbooks; the
+src/data/billion/ copies used to be a second, separately generated file per dataset.
+Here all amounts of a file are gathered into one array, divided in a single numpy pass
+per scale and written out as materialized copies.
+
+    python scripts/scale_views.py                                   # regenerate src/data/billion from src/data/raw
+    python scripts/scale_views.py data/json --scales million,billion --out data/json/scaled
+"""
+
+import os
+import json
+import argparse
+import numpy as np
+
+SRC_DIR = "fiscalinsight-taiwan/src/data/raw"
+OUT_DIR = "fiscalinsight-taiwan/src/data"
+# Divisor from the source unit (NT$ thousand) to each view
+SCALES = {"thousand": 1, "million": 1_000, "billion": 1_000_000}
+DECIMALS = 2
+# Integer fields that hold money; everything else (year, name_id, depth, parent, child_start, ...) is left as is
+AMOUNT_KEYS = {"amount", "value", "total", "income", "expense", "surplus", "revenue", "expenditure",
+               "sheet_total", "subtree_sum"}
+
+
+def amount_slots(obj, slots=None):
+    """(container, key) for every integer amount in obj, in document order."""
+    if slots is None:
+        slots = []
+    if isinstance(obj, dict):
+        items = obj.items()
+    elif isinstance(obj, list):
+        items = enumerate(obj)
+    else:
+        return slots
+    for key, value in items:
+        if isinstance(value, int) and not isinstance(value, bool):
+            if key in AMOUNT_KEYS:
+                slots.append((obj, key))
+        elif isinstance(value, (dict, list)):
+            amount_slots(value, slots)
+    return slots
+
+def scaled_values(raw, divisor):
+    """raw / divisor rounded to DECIMALS, as Python numbers (ints stay ints for divisor 1)."""
+    if divisor == 1:
+        return raw.tolist()
+    # Python's round() on the float quotient, as the billion/ files have always been rounded,
+    # so regenerating them leaves the committed values unchanged (np.round differs on ties)
+    return [round(v, DECIMALS) for v in (raw / divisor).tolist()]
+
+def write_views(data, name, scales, out_dir):
+    """Write one copy of data per scale to <out_dir>/<scale>/<name>, reusing one pass over the document."""
+    slots = amount_slots(data)
+    raw = np.array([container[key] for container, key in slots], dtype=np.int64)
+    written = []
+    for scale in scales:
+        # The same document is re-filled per scale, so no per-scale deep copy is made
+        for (container, key), value in zip(slots, scaled_values(raw, SCALES[scale])):
+            container[key] = value
+        path = os.path.join(out_dir, scale, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        written.append(path)
+    for (container, key), value in zip(slots, raw.tolist()):
+        container[key] = value
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description="Derive scaled views from the canonical integer JSON outputs")
+    parser.add_argument("src", nargs="?", default=SRC_DIR, help=f"Directory of integer JSON files (default: {SRC_DIR})")
+    parser.add_argument("--out", default=OUT_DIR, help=f"Parent directory of the <scale>/ copies (default: {OUT_DIR})")
+    parser.add_argument("--scales", default="billion",
+                        help=f"Comma-separated views: {', '.join(SCALES)} (default: billion)")
+    args = parser.parse_args()
+
+    scales = [s.strip() for s in args.scales.split(",") if s.strip()]
+    unknown = [s for s in scales if s not in SCALES]
+    if unknown:
+        parser.error(f"Unknown scale(s): {', '.join(unknown)}")
+
+    names = sorted(f for f in os.listdir(args.src) if f.endswith(".json") and not f.endswith(".columnar.json"))
+    for name in names:
+        with open(os.path.join(args.src, name), encoding='utf-8') as f:
+            data = json.load(f)
+        for path in write_views(data, name, scales, args.out):
+            print(f"Generated {path}")
+
+if __name__ == "__main__":
+    main()
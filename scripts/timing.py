@@ -0,0 +1,151 @@
+"""
+Lightweight timing spans for the ETL stages (discover, workbook.read/probe, header,
+extract, aggregate, serialize, ...). Spans nest: each records its inclusive time and its
+self time (minus nested spans), accumulated per name for the whole run.
+Pool workers send their spans back with each year's result (see imap_years), so a
+--workers run is reported as a whole; span totals then add up CPU time over all workers
+and can exceed the wall time.
+
+    python scripts/transform_revenue.py --timing timing.json
+    python scripts/etl_budget.py --profile etl.prof                 # cProfile, view with snakeviz/pstats
+    python scripts/etl_budget.py --profile etl.html --profiler pyinstrument
+"""
+
+import os
+import sys
+import json
+import time
+import functools
+from contextlib import contextmanager
+
+# name -> [count, seconds, self seconds]
+_spans = {}
+# name -> {label: seconds}, for spans opened with a label (e.g. per-year times)
+_labels = {}
+# Open spans of this process: [name, time spent in nested spans]
+_stack = []
+
+
+@contextmanager
+def span(name, label=None):
+    start = time.perf_counter()
+    frame = [name, 0.0]
+    _stack.append(frame)
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _stack.pop()
+        if _stack:
+            _stack[-1][1] += elapsed
+        entry = _spans.setdefault(name, [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += elapsed
+        entry[2] += elapsed - frame[1]
+        if label is not None:
+            labels = _labels.setdefault(name, {})
+            labels[str(label)] = labels.get(str(label), 0.0) + elapsed
+
+def timed(name):
+    """Decorator form of span for a whole function."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def reset():
+    _spans.clear()
+    _labels.clear()
+
+def snapshot():
+    return {"spans": {k: list(v) for k, v in _spans.items()},
+            "labels": {k: dict(v) for k, v in _labels.items()}}
+
+def merge(snap):
+    """Add a snapshot taken in another process (a pool worker) to this process's totals."""
+    for name, (count, seconds, self_seconds) in snap["spans"].items():
+        entry = _spans.setdefault(name, [0, 0.0, 0.0])
+        entry[0] += count
+        entry[1] += seconds
+        entry[2] += self_seconds
+    for name, labels in snap["labels"].items():
+        target = _labels.setdefault(name, {})
+        for label, seconds in labels.items():
+            target[label] = target.get(label, 0.0) + seconds
+
+def timed_call(fn, arg):
+    """Run fn(arg) in a pool worker under a "year" span; returns (result, that call's spans)."""
+    reset()
+    with span("year", arg):
+        result = fn(arg)
+    return result, snapshot()
+
+def report(wall_seconds, args=None):
+    spans = sorted(_spans.items(), key=lambda kv: -kv[1][2])
+    return {
+        "script": os.path.basename(sys.argv[0]),
+        "argv": sys.argv[1:],
+        "workers": getattr(args, "workers", 1),
+        "wall_seconds": round(wall_seconds, 4),
+        "spans": {name: {"count": count, "seconds": round(seconds, 4), "self_seconds": round(self_seconds, 4),
+                         "mean_ms": round(seconds / count * 1000, 3)}
+                  for name, (count, seconds, self_seconds) in spans},
+        "labels": {name: {label: round(s, 4) for label, s in labels.items()} for name, labels in _labels.items()},
+    }
+
+def _start_profiler(kind):
+    if kind == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("Skipping --profile: pyinstrument is not installed (pip install pyinstrument).")
+            return None
+        profiler = Profiler()
+        profiler.start()
+    else:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    return profiler
+
+def _dump_profiler(profiler, kind, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if kind == "cprofile":
+        profiler.disable()
+        profiler.dump_stats(path)
+    else:
+        profiler.stop()
+        output = profiler.output_html() if path.endswith(".html") else profiler.output_text()
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(output)
+    # Pool workers are separate processes and are not in the profile
+    print(f"Wrote {kind} profile to {path}")
+
+@contextmanager
+def session(args):
+    """
+    Time one script run: reset the spans, profile if --profile was given, and write
+    the --timing JSON report (and a short summary) when the run ends.
+    """
+    reset()
+    kind = getattr(args, "profiler", "cprofile")
+    profiler = _start_profiler(kind) if getattr(args, "profile", None) else None
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - start
+        if profiler is not None:
+            _dump_profiler(profiler, kind, args.profile)
+        if getattr(args, "timing", None):
+            result = report(wall, args)
+            os.makedirs(os.path.dirname(os.path.abspath(args.timing)), exist_ok=True)
+            with open(args.timing, 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+            print(f"Wall time {wall:.2f}s; self time by stage:")
+            for name, stats in result["spans"].items():
+                print(f"  {name:<16} {stats['self_seconds']:8.3f}s  x{stats['count']}")
+            print(f"Wrote timing report to {args.timing}")
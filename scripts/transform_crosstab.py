@@ -0,0 +1,289 @@
+"""
+Agency × category cross-tabs (各機關歲出政事別科目分析總表 and 各機關歲入來源別科目分析總表)
+as sparse matrices.
+
+The expenditure sheet has one row per function (政事別 款) and one column per agency
+(N款…主管); the revenue sheet has one row per agency and one column per source
+(稅課收入, 規費收入, …, under 經常收入 / 資本收入). Both are stored agency-major: every
+non-zero cell becomes one COO entry (year, agency, category, amount), with agency and
+category names kept once in dictionaries shared by all years. Entries are sorted by
+(year, agency, category), so one year is a contiguous slice and each agency's cells
+within it are a CSR row.
+
+Outputs: data/unified/crosstab_agency_function.npz and crosstab_agency_source.npz
+(numpy arrays only, loadable with CrossTab.load or np.load).
+"""
+
+import os
+import re
+import sys
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from workbook_loader import read_workbook, set_cache_enabled
+from record_store import StringTable
+from name_registry import NameRegistry, REGISTRY_FILE
+from timing import session, span, timed
+from transform_utils import (HeaderIndex, build_arg_parser, clean_number_array, get_ad_year, iter_years,
+                             text_column)
+import budget_parser
+
+# Configuration
+BASE_DIR = "docs/tw-finance"
+OUTPUT_DIR = "data/unified"
+TARGET_YEARS = range(97, 115)
+
+AGENCY_COLUMN_RE = re.compile(r"^(\d+)款(.+)$")
+TOTAL_LABEL = "合計"
+
+# Same spec shape as budget_parser's, so find_budget_file picks the workbook
+FUNCTION_SPEC = {
+    "label": "agency×function",
+    "file_match": lambda f: "各機關歲出政事別" in f and not f.startswith("~"),
+    # Year 99 ships the cross-tabs under numeric file names
+    "content_match": lambda head: re.search(r"1款\s*總統府主管", head) is not None,
+    "transpose": True,
+}
+SOURCE_SPEC = {
+    "label": "agency×source",
+    "file_match": lambda f: "各機關歲入來源別" in f and not f.startswith("~"),
+    "content_match": lambda head: "罰款及賠償收入" in head and "規費收入" in head,
+    "transpose": False,
+}
+TABLES = {"agency_function": FUNCTION_SPEC, "agency_source": SOURCE_SPEC}
+
+
+def _column_labels(df, spec):
+    """
+    (header row position, {column position: category or agency name}, total column or None).
+    Agency columns are the "N款…主管" cells; source columns are the named cells of the
+    header row, with a 財產收入 that appears under both 經常收入 and 資本收入 suffixed
+    (經)/(資) as the older sheets label it.
+    """
+    header = HeaderIndex(df, 10)
+    if spec["transpose"]:
+        label_row = next((r for r, row in enumerate(header.clean)
+                          if any(AGENCY_COLUMN_RE.match(c) for c in row)), None)
+    else:
+        label_row = next((r for r, row in enumerate(header.clean) if "稅課收入" in row), None)
+    if label_row is None:
+        return None, {}, None
+
+    # Older sheets break "1款\r總統府主管" inside the cell
+    cells = [re.sub(r"\s+", "", c) for c in header.clean[label_row]]
+    groups = [re.sub(r"\s+", "", c) for c in header.clean[label_row - 1]] if label_row > 0 else [""] * len(cells)
+    total_col = None
+    labels = {}
+    group = ""
+    for col, (cell, group_cell) in enumerate(zip(cells, groups)):
+        if TOTAL_LABEL in (cell, group_cell):
+            total_col = col
+            continue
+        if group_cell:
+            group = group_cell
+        if spec["transpose"]:
+            m = AGENCY_COLUMN_RE.match(cell)
+            if m:
+                labels[col] = m.group(2)
+        elif col >= 2 and cell and not cell.isdigit() and cell not in ("款", "項", "名稱", "科目名稱"):
+            labels[col] = cell
+
+    if not spec["transpose"]:
+        names = list(labels.values())
+        for col, name in labels.items():
+            if names.count(name) > 1 and group:
+                labels[col] = f"{name}({groups[col][:1] or _group_before(groups, col)[:1]})"
+    return label_row, labels, total_col
+
+def _group_before(groups, col):
+    """The merged group header covering col (the nearest non-empty cell to its left)."""
+    return next((g for g in reversed(groups[:col + 1]) if g), "")
+
+@timed("extract")
+def parse_crosstab(df, spec):
+    """
+    One cross-tab sheet as (agency names, category names, agency idx, category idx, amounts),
+    indexes local to this sheet and only non-zero cells kept; None when no header is found.
+    """
+    label_row, labels, total_col = _column_labels(df, spec)
+    if not labels:
+        return None
+
+    # Newer sheets put the 合計 column between the row labels and the first agency
+    first_value_col = min(list(labels) + ([total_col] if total_col is not None else []))
+    codes = text_column(df.iloc[label_row + 1:, 0])
+    rows = np.flatnonzero(codes.str.isdigit().to_numpy()) + label_row + 1
+    # Row name: the last non-numeric text among the label columns (款 [項] 名稱)
+    label_block = df.iloc[rows, 1:first_value_col]
+    names = [next((c for c in reversed([str(v).strip() for v in vals]) if c and c != "nan" and not c.isdigit()), "")
+             for vals in label_block.itertuples(index=False)]
+    names = [re.sub(r"\s+", "", n) for n in names]
+
+    cols = sorted(labels)
+    grid = np.column_stack([clean_number_array(df.iloc[rows, c])[0] for c in cols])
+
+    if total_col is not None:
+        totals = clean_number_array(df.iloc[rows, total_col])[0]
+        off = int((grid.sum(axis=1) != totals).sum())
+        if off:
+            print(f"  Warning: {off} row(s) of the {spec['label']} table do not add up to their {TOTAL_LABEL} column")
+
+    row_idx, col_idx = np.nonzero(grid)
+    values = grid[row_idx, col_idx]
+    col_names = [labels[c] for c in cols]
+    if spec["transpose"]:
+        # Sheet rows are functions and columns agencies; store agency-major
+        return col_names, names, col_idx, row_idx, values
+    return names, col_names, row_idx, col_idx, values
+
+def process_year(year):
+    """{table: parse_crosstab result} for one year; tables without a workbook are left out."""
+    year_dir = os.path.join(BASE_DIR, str(year))
+    result = {"year": get_ad_year(year)}
+    if not os.path.exists(year_dir):
+        return result
+    for table, spec in TABLES.items():
+        path = budget_parser.find_budget_file(year_dir, spec)
+        if path is None:
+            print(f"[{year}] No {spec['label']} file found.")
+            continue
+        print(f"[{year}] Processing {os.path.basename(path)}...")
+        try:
+            parsed = parse_crosstab(read_workbook(path), spec)
+        except Exception as e:
+            print(f"  Error processing {year} {spec['label']}: {e}")
+            continue
+        if parsed is None:
+            print(f"  Warning: No header found in {os.path.basename(path)}")
+            continue
+        result[table] = parsed
+    return result
+
+
+class CrossTab:
+    """
+    Sparse agency × category amounts over all years: parallel COO arrays sorted by
+    (year, agency, category), plus the agency and category name dictionaries and, when
+    built with a NameRegistry, the registry id of each dictionary entry.
+    """
+
+    def __init__(self, years, agency, category, amount, agencies, categories, agency_ids=None, category_ids=None):
+        self.years = np.asarray(years, dtype=np.int16)
+        self.agency = np.asarray(agency, dtype=np.int32)
+        self.category = np.asarray(category, dtype=np.int32)
+        self.amount = np.asarray(amount, dtype=np.int64)
+        self.agencies = list(agencies)
+        self.categories = list(categories)
+        self.agency_ids = None if agency_ids is None else np.asarray(agency_ids, dtype=np.int32)
+        self.category_ids = None if category_ids is None else np.asarray(category_ids, dtype=np.int32)
+        self._agency_index = {name: i for i, name in enumerate(self.agencies)}
+        self._category_index = {name: i for i, name in enumerate(self.categories)}
+
+    def __len__(self):
+        return len(self.amount)
+
+    def save(self, path):
+        # Fixed-width unicode arrays, so np.load needs no pickle
+        ids = {} if self.agency_ids is None else {"agency_ids": self.agency_ids, "category_ids": self.category_ids}
+        np.savez_compressed(path, year=self.years, agency=self.agency, category=self.category, amount=self.amount,
+                            agencies=np.array(self.agencies, dtype=str), categories=np.array(self.categories, dtype=str),
+                            **ids)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as z:
+            ids = (z["agency_ids"], z["category_ids"]) if "agency_ids" in z else (None, None)
+            return cls(z["year"], z["agency"], z["category"], z["amount"],
+                       z["agencies"].tolist(), z["categories"].tolist(), *ids)
+
+    def _year(self, year):
+        lo, hi = np.searchsorted(self.years, [year, year + 1])
+        return slice(lo, hi)
+
+    def csr(self, year):
+        """(indptr, category indices, amounts) of one year, one CSR row per agency in self.agencies."""
+        s = self._year(year)
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(self.agency[s], minlength=len(self.agencies)))])
+        return indptr, self.category[s], self.amount[s]
+
+    def agency_row(self, year, agency):
+        """{category: amount} of one agency in one year."""
+        indptr, cats, amounts = self.csr(year)
+        i = self._agency_index.get(agency)
+        if i is None:
+            return {}
+        lo, hi = indptr[i], indptr[i + 1]
+        return {self.categories[c]: int(v) for c, v in zip(cats[lo:hi], amounts[lo:hi])}
+
+    def category_column(self, year, category):
+        """{agency: amount} of one category in one year."""
+        s = self._year(year)
+        j = self._category_index.get(category)
+        hit = self.category[s] == j
+        return {self.agencies[a]: int(v) for a, v in zip(self.agency[s][hit], self.amount[s][hit])}
+
+    def dense(self, year):
+        s = self._year(year)
+        grid = np.zeros((len(self.agencies), len(self.categories)), dtype=np.int64)
+        grid[self.agency[s], self.category[s]] = self.amount[s]
+        return grid
+
+    def to_scipy(self, year):
+        """One year as a scipy.sparse CSR matrix (scipy is optional)."""
+        from scipy.sparse import csr_matrix
+        indptr, cats, amounts = self.csr(year)
+        return csr_matrix((amounts, cats, indptr), shape=(len(self.agencies), len(self.categories)))
+
+
+def build_crosstabs(results, registry=None):
+    """
+    Merge per-year parse results into one CrossTab per table, re-coding names into shared
+    dictionaries (and giving each entry its registry id when a NameRegistry is passed).
+    """
+    parts = {table: [] for table in TABLES}
+    dictionaries = {table: (StringTable(), StringTable()) for table in TABLES}
+    for res in results:
+        for table in TABLES:
+            if table not in res:
+                continue
+            agency_names, category_names, agency_idx, category_idx, values = res[table]
+            agencies, categories = dictionaries[table]
+            agency_codes = agencies.codes(agency_names)[agency_idx]
+            category_codes = categories.codes(category_names)[category_idx]
+            # Agency-major within the year, so the merged arrays stay sorted by (year, agency, category)
+            order = np.lexsort((category_codes, agency_codes))
+            parts[table].append((np.full(len(order), res["year"]), agency_codes[order],
+                                 category_codes[order], np.asarray(values)[order]))
+
+    tabs = {}
+    for table, chunks in parts.items():
+        if not chunks:
+            continue
+        agencies, categories = dictionaries[table]
+        ids = (None, None) if registry is None else (registry.ids(agencies.strings), registry.ids(categories.strings))
+        tabs[table] = CrossTab(*(np.concatenate(arrays) for arrays in zip(*chunks)),
+                               agencies.strings, categories.strings, *ids)
+    return tabs
+
+def main():
+    args = build_arg_parser("Build the agency×function / agency×source sparse cross-tabs in data/unified").parse_args()
+    with session(args):
+        run(args)
+
+def run(args):
+    set_cache_enabled(not args.no_cache)
+    registry = NameRegistry.load(REGISTRY_FILE)
+    tabs = build_crosstabs(iter_years(process_year, TARGET_YEARS, args, BASE_DIR), registry)
+    registry.warn_missing()
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    for table, tab in tabs.items():
+        path = os.path.join(OUTPUT_DIR, f"crosstab_{table}.npz")
+        with span("serialize"):
+            tab.save(path)
+        print(f"Generated {path}: {len(tab)} non-zero cells, {len(set(tab.years.tolist()))} years, "
+              f"{len(tab.agencies)} agencies x {len(tab.categories)} categories "
+              f"({os.path.getsize(path) / 1024:.1f} KB)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+import os
+import sys
+
+# Add script dir to import utils
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import budget_parser
+
+# Configuration
+BASE_DIR = "docs/tw-finance"
+OUTPUT_DIR = "data/json"
+# With --sharded: the expenditure_by_agency/ directory; with --tree: also expenditure_by_agency_tree.json
+OUTPUT_FILE = os.path.join(OUTPUT_DIR, "expenditure_by_agency.json")
+# Years 97 to 114
+TARGET_YEARS = range(97, 115) 
+
+def process_year(year):
+    return budget_parser.process_year(year, budget_parser.AGENCY_SPEC, BASE_DIR)
+
+def main():
+    budget_parser.table_main(process_year, TARGET_YEARS, BASE_DIR, OUTPUT_FILE)
+
+if __name__ == "__main__":
+    main()
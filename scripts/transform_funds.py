@@ -5,7 +5,11 @@ import sys
 
 # Add script dir to path to import utils
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from transform_utils import get_ad_year, clean_str, clean_number, find_header_row
+from workbook_loader import read_workbook, set_cache_enabled
+from columnar_json import write_compact
+from category_mapper import KeywordMapper
+from timing import session, span, timed
+from transform_utils import get_ad_year, clean_str, clean_number_list, find_header_row, build_arg_parser, run_years
 
 # Configuration
 BASE_DIR = "docs/tw-finance"
@@ -22,23 +26,24 @@ TYPE_MAP = {
     "資本": "capital plan", # 資本計畫
 }
 
+FUND_TYPES = KeywordMapper(TYPE_MAP.items(), default="other")
+
 def guess_type(section_name):
-    for k, v in TYPE_MAP.items():
-        if k in section_name:
-            return v
-    return "other"
+    return FUND_TYPES.match(section_name)
 
+@timed("extract")
 def process_year(year):
     year_dir = os.path.join(BASE_DIR, str(year))
     if not os.path.exists(year_dir):
         return None
 
     # Find the file
-    target_file = None
-    for f in os.listdir(year_dir):
-        if "基金" in f and "分析" in f and not f.startswith("~"):
-             target_file = os.path.join(year_dir, f)
-             break
+    with span("discover"):
+        target_file = None
+        for f in os.listdir(year_dir):
+            if "基金" in f and "分析" in f and not f.startswith("~"):
+                 target_file = os.path.join(year_dir, f)
+                 break
     
     if not target_file:
         print(f"[{year}] No fund file found.")
@@ -47,7 +52,7 @@ def process_year(year):
     print(f"[{year}] Processing {os.path.basename(target_file)}...")
     
     try:
-        df = pd.read_excel(target_file, header=None)
+        df = read_workbook(target_file)
         
         # 1. Detect Header
         keywords = ["基金名稱", "基金來源", "基金用途", "本年度", "預算數", "基金別"]
@@ -107,6 +112,9 @@ def process_year(year):
 
         current_major_section = "" # "Basic" or "Special"
         current_sub_section_type = "business" 
+        # Amounts are cleaned a whole column at a time; the row loop only picks them up
+        incomes = clean_number_list(df, inc_col)
+        expenses = clean_number_list(df, exp_col)
         
         for i in range(start_row, len(df)):
             row = df.iloc[i]
@@ -124,10 +132,8 @@ def process_year(year):
             if not final_name: continue
             
             # Values
-            inc = 0
-            exp = 0
-            if inc_col < len(row): inc = clean_number(row[inc_col])
-            if exp_col < len(row): exp = clean_number(row[exp_col])
+            inc = incomes[i]
+            exp = expenses[i]
             
             if inc == 0 and exp == 0:
                  # Even if 0, might be a header.
@@ -197,21 +203,28 @@ def process_year(year):
         return None
 
 def main():
-    all_data = []
-    
-    for year in TARGET_YEARS:
-        res = process_year(year)
-        if res:
-            all_data.append(res)
+    parser = build_arg_parser("Build data/json/funds.json")
+    parser.add_argument("--compact", action="store_true",
+                        help="Also write a minified columnar copy (<name>.columnar.json, see columnar_json.py) and report sizes")
+    args = parser.parse_args()
+    with session(args):
+        run(args)
+
+def run(args):
+    set_cache_enabled(not args.no_cache)
+    all_data = [res for res in run_years(process_year, TARGET_YEARS, args, BASE_DIR) if res]
             
     # Write Output
     if not os.path.exists(OUTPUT_DIR):
         os.makedirs(OUTPUT_DIR)
         
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
+    with span("serialize"), open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
         json.dump(all_data, f, ensure_ascii=False, indent=2)
         
     print(f"Generated {OUTPUT_FILE} with {len(all_data)} year records.")
+    if args.compact:
+        with span("serialize"):
+            write_compact(all_data, OUTPUT_FILE)
 
 if __name__ == "__main__":
     main()
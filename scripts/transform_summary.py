@@ -5,7 +5,11 @@ import sys
 
 # Add script dir to path to import utils
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from transform_utils import get_ad_year, clean_str, clean_number, find_header_row
+from workbook_loader import read_workbook, set_cache_enabled
+from columnar_json import write_compact
+from category_mapper import load_category_map
+from timing import session, span, timed
+from transform_utils import get_ad_year, clean_str, clean_number_list, find_header_row, build_arg_parser, run_years
 
 # Configuration
 BASE_DIR = "docs/tw-finance"
@@ -13,38 +17,22 @@ OUTPUT_DIR = "data/json"
 OUTPUT_FILE = os.path.join(OUTPUT_DIR, "summary.json")
 TARGET_YEARS = range(97, 115) # 97 to 114
 
-# Category Mappings (Hardcoded for stability as names are consistent)
-# Map: Keyword -> (Type, Standard Name)
-CATEGORY_MAP = {
-    # Revenue
-    "稅課": ("revenue", "稅課收入"),
-    "營業盈餘": ("revenue", "營業盈餘及事業收入"),
-    "規費": ("revenue", "規費及罰款收入"),
-    "財產收入": ("revenue", "財產收入"),
-    "其他收入": ("revenue", "其他收入"),
-    # Expenditure
-    "政務支出": ("expenditure", "一般政務支出"),
-    "國防支出": ("expenditure", "國防支出"),
-    "教育科學": ("expenditure", "教育科學文化支出"),
-    "經濟發展": ("expenditure", "經濟發展支出"),
-    "社會福利": ("expenditure", "社會福利支出"),
-    "社區發展": ("expenditure", "社區發展及環境保護支出"),
-    "退休撫卹": ("expenditure", "退休撫卹支出"),
-    "債務支出": ("expenditure", "債務支出"),
-    "補助及其他": ("expenditure", "補助及其他支出")
-}
+# Raw row name -> standard category, compiled from the spec's "match" keywords
+CATEGORIES = load_category_map()
 
+@timed("extract")
 def process_year(year):
     year_dir = os.path.join(BASE_DIR, str(year))
     if not os.path.exists(year_dir):
         return None
 
     # Find the summary file
-    target_file = None
-    for f in os.listdir(year_dir):
-        if "歲入歲出簡明比較" in f and (f.endswith(".xls") or f.endswith(".xlsx")) and not f.startswith("~"):
-            target_file = os.path.join(year_dir, f)
-            break
+    with span("discover"):
+        target_file = None
+        for f in os.listdir(year_dir):
+            if "歲入歲出簡明比較" in f and (f.endswith(".xls") or f.endswith(".xlsx")) and not f.startswith("~"):
+                target_file = os.path.join(year_dir, f)
+                break
     
     if not target_file:
         print(f"[{year}] No summary file found.")
@@ -53,7 +41,7 @@ def process_year(year):
     print(f"[{year}] Processing {os.path.basename(target_file)}...")
     
     try:
-        df = pd.read_excel(target_file, header=None)
+        df = read_workbook(target_file)
         
         # 1. Detect Header
         # Look for "項目" and "預算數" (or similar)
@@ -93,13 +81,15 @@ def process_year(year):
             "expenditure_categories": []
         }
         
+        amounts = clean_number_list(df, amt_col)
+        seen = set()
+        
         for i in range(start_row, len(df)):
             row = df.iloc[i]
             if name_col >= len(row) or amt_col >= len(row): continue
             
             raw_name = clean_str(row[name_col])
-            raw_amt = row[amt_col]
-            amount = clean_number(raw_amt)
+            amount = amounts[i]
             
             if not raw_name: continue
             
@@ -110,18 +100,16 @@ def process_year(year):
                 year_data["expenditure"] = amount
             
             # Map Categories
-            matched = False
-            for kw, (cat_type, std_name) in CATEGORY_MAP.items():
-                if kw in raw_name:
-                    target_list = year_data["revenue_categories"] if cat_type == "revenue" else year_data["expenditure_categories"]
-                    # Check if already added (some files duplicate rows or have subtotals)
-                    if not any(d['name'] == std_name for d in target_list):
-                        target_list.append({
-                            "name": std_name,
-                            "amount": amount
-                        })
-                    matched = True
-                    break
+            category = CATEGORIES.match(raw_name)
+            if category is not None:
+                # Some files duplicate rows or have subtotals; keep the first
+                key = (category["type"], category["name"])
+                if key not in seen:
+                    seen.add(key)
+                    year_data[f"{category['type']}_categories"].append({
+                        "name": category["name"],
+                        "amount": amount
+                    })
             
         return year_data
 
@@ -130,21 +118,28 @@ def process_year(year):
         return None
 
 def main():
-    all_data = []
-    
-    for year in TARGET_YEARS:
-        res = process_year(year)
-        if res:
-            all_data.append(res)
+    parser = build_arg_parser("Build data/json/summary.json")
+    parser.add_argument("--compact", action="store_true",
+                        help="Also write a minified columnar copy (<name>.columnar.json, see columnar_json.py) and report sizes")
+    args = parser.parse_args()
+    with session(args):
+        run(args)
+
+def run(args):
+    set_cache_enabled(not args.no_cache)
+    all_data = [res for res in run_years(process_year, TARGET_YEARS, args, BASE_DIR) if res]
             
     # Write Output
     if not os.path.exists(OUTPUT_DIR):
         os.makedirs(OUTPUT_DIR)
         
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
+    with span("serialize"), open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
         json.dump(all_data, f, ensure_ascii=False, indent=2)
         
     print(f"Generated {OUTPUT_FILE} with {len(all_data)} records.")
+    if args.compact:
+        with span("serialize"):
+            write_compact(all_data, OUTPUT_FILE)
 
 if __name__ == "__main__":
     main()
@@ -1,5 +1,27 @@
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import sys
+import numpy as np
 import pandas as pd
 import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from workbook_loader import file_sha256
+from category_mapper import CATEGORY_MAP_FILE
+from timing import span, timed, merge, timed_call
+
+# Per-year results of --incremental runs: <script>/manifest.json + <script>/<year>.pkl
+# (pickled, since results may be RecordStores rather than plain JSON data)
+INCREMENTAL_DIR = os.path.join(".cache", "incremental")
+# Modules whose changes invalidate every stored year
+SHARED_MODULES = ["transform_utils.py", "workbook_loader.py", "budget_parser.py", "record_store.py",
+                  "category_mapper.py"]
+# Rule files read at run time (relative to the working directory, as their readers open them)
+SHARED_DATA = [CATEGORY_MAP_FILE]
 
 def get_ad_year(roc_year):
     """Convert ROC year to AD year."""
@@ -32,29 +54,273 @@ def clean_number(val):
     except ValueError:
         return 0
 
+def text_column(col):
+    """str() of every cell in a column, with NaN as "" (the vector form of `str(val) if not pd.isna(val)`)."""
+    return col.astype(object).where(col.notna(), "").map(str)
+
+def clean_str_column(col):
+    """Vectorized clean_str over a whole column."""
+    text = text_column(col).str.strip()
+    return text.str.replace('\n', '', regex=False).str.replace('　', '', regex=False).str.replace(' ', '', regex=False)
+
+# Full-width digits and signs as they appear in hand-typed cells, mapped to ASCII
+FULLWIDTH_NUMBER = str.maketrans("０１２３４５６７８９，．－＋", "0123456789,.-+")
+BLANK_NUMBERS = ['-', '', 'nan', 'None']
+
+def clean_number_array(col):
+    """
+    Vectorized clean_number over a whole column (object or numeric dtype).
+    Returns (int64 ndarray, unparseable mask): blanks, '-' and NaN are 0 and not flagged;
+    cells that still are not numbers after stripping commas, spaces and full-width
+    characters are 0 and flagged, so callers can report them instead of guessing.
+    """
+    values = col.to_numpy() if isinstance(col, pd.Series) else np.asarray(col)
+    if values.dtype.kind in "iub":
+        return values.astype(np.int64), np.zeros(len(values), dtype=bool)
+    if values.dtype.kind == "f":
+        # Numeric fast path: no text at all, only NaN blanks (and inf, which int() rejects)
+        return np.where(np.isfinite(values), values, 0).astype(np.int64), np.isinf(values)
+
+    # Mixed cells: numbers (and NaN blanks) convert directly, only the text cells are cleaned
+    if isinstance(col, pd.Series) and isinstance(col.dtype, pd.StringDtype):
+        is_text = col.notna().to_numpy()
+    else:
+        is_text = np.fromiter((isinstance(v, str) for v in values), dtype=bool, count=len(values))
+    values = values.astype(object)
+    nums = np.zeros(len(values), dtype=np.float64)
+    bad = np.zeros(len(values), dtype=bool)
+    nums[~is_text] = pd.to_numeric(values[~is_text], errors='coerce')
+    if is_text.any():
+        text = pd.Series(values[is_text]).str.strip()
+        # Most text cells are the '-' / blank placeholders, which skip the cleanup entirely
+        blank = text.isin(BLANK_NUMBERS).to_numpy()
+        parsed = np.zeros(len(text), dtype=np.float64)
+        if not blank.all():
+            rest = text[~blank].str.translate(FULLWIDTH_NUMBER)
+            rest = rest.str.replace(',', '', regex=False).str.replace(' ', '', regex=False).str.replace('　', '', regex=False)
+            rest = rest.where(~rest.isin(BLANK_NUMBERS), "0")
+            parsed[~blank] = pd.to_numeric(rest, errors='coerce')
+        nums[is_text] = parsed
+        bad[is_text] = np.isnan(parsed)
+    bad |= np.isinf(nums)
+    return np.where(np.isfinite(nums), nums, 0).astype(np.int64), bad
+
+def clean_number_list(df, col_idx):
+    """clean_number of every cell in column position col_idx as Python ints (all 0 if the sheet is narrower)."""
+    if col_idx >= df.shape[1]:
+        return [0] * len(df)
+    return clean_number_array(df.iloc[:, col_idx])[0].tolist()
+
+def fill_hierarchy(labels, markers):
+    """
+    Vectorized Kuan/Xiang/Mu/Jie state machine.
+    labels / markers: one Series per level (k, x, m, j) over the same rows;
+    a row whose marker is set starts a new node at that level, labelled with labels[level].
+    A new node resets every level below it, so each level is its label where its marker
+    is set, "" where a higher marker is set, and otherwise carried forward from the row above.
+    Returns the filled state of each level per row.
+    """
+    filled = []
+    higher = pd.Series(False, index=markers[0].index)
+    for label, marker in zip(labels, markers):
+        state = pd.Series(None, index=marker.index, dtype=object)
+        state[higher] = ""
+        state[marker] = label[marker]
+        filled.append(state.ffill().fillna(""))
+        higher = higher | marker
+    return filled
+
+class HeaderIndex:
+    """
+    The top rows of one sheet, cleaned once and shared by every header / column / file-type
+    query on that workbook, so detection no longer re-scans (and re-cleans) the grid per query.
+    Keeps per cell the raw str(), the stripped str() and clean_str() text, an exact
+    cleaned-token -> first (row, col) map, and the joined text for substring probes.
+    Rows are returned as labels of df.index, columns as positions.
+    """
+
+    @timed("header")
+    def __init__(self, df, max_rows=20):
+        head = df.head(max_rows)
+        self.labels = list(head.index)
+        values = head.values.tolist()
+        self.raw = [[str(v) for v in row] for row in values]
+        self.clean = [[clean_str(v) for v in row] for row in values]
+        self.raw_rows = [" ".join(row) for row in self.raw]
+        self.clean_rows = ["".join(row) for row in self.clean]
+        # Whole-probe text for the file classification keywords (cells never join across a boundary)
+        self.text = "\n".join(self.raw_rows)
+        self.tokens = {}
+        for r, row in enumerate(self.clean):
+            for c, token in enumerate(row):
+                self.tokens.setdefault(token, (r, c))
+
+    def contains(self, keyword):
+        return keyword in self.text
+
+    def header_row(self, keywords, max_rows=20, threshold=2):
+        """
+        Row with the MOST keywords in its cleaned text (e.g. "名 稱" -> "名稱"); on ties the later row
+        wins, since a title row can share words with the real header below it.
+        """
+        best_row = None
+        max_matches = 0
+        for label, text in zip(self.labels[:max_rows], self.clean_rows):
+            matches = sum(1 for k in keywords if k in text)
+            if matches >= threshold and matches >= max_matches:
+                max_matches = matches
+                best_row = label
+        return best_row
+
+    def first_row(self, keywords, max_rows=15, threshold=2):
+        """First row whose space-joined raw text contains at least `threshold` of the keywords."""
+        for label, text in zip(self.labels[:max_rows], self.raw_rows):
+            if sum(1 for k in keywords if k in text) >= threshold:
+                return label
+        return None
+
+    def first_row_by_cells(self, keywords, max_rows=15, threshold=2):
+        """First row with at least `threshold` cells containing one of the keywords."""
+        for label, row in zip(self.labels[:max_rows], self.raw):
+            if sum(1 for val in row if any(k in val.strip() for k in keywords)) >= threshold:
+                return label
+        return None
+
+    def column(self, keywords, max_rows=15):
+        """
+        Column of the first cell (row-major) whose cleaned text is one of the keywords; failing that,
+        the first cell containing a multi-character keyword or equal to a single-character one,
+        so '款' / '項' never match inside '科目款項'.
+        """
+        exact = [self.tokens[k] for k in keywords if k in self.tokens and self.tokens[k][0] < max_rows]
+        if exact:
+            return min(exact)[1]
+        for row in self.clean[:max_rows]:
+            for c, val in enumerate(row):
+                for k in keywords:
+                    if (k == val) if len(k) == 1 else (k in val):
+                        return c
+        return None
+
+
 def find_header_row(df, keywords, max_scan=20):
     """
     Find the index of the row with the MOST keyword matches.
     Scans the first `max_scan` rows using CLEANED values to handle spaces.
     e.g. "名 稱" -> "名稱".
+    Build a HeaderIndex directly when the same sheet is queried more than once.
+    """
+    return HeaderIndex(df, max_scan).header_row(keywords, max_scan)
+
+def build_arg_parser(description):
+    """Common CLI flags shared by every ETL script."""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Process fiscal years in N parallel worker processes (default: 1, serial)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Bypass the on-disk parsed-workbook cache (.cache/workbooks) and re-read every Excel file")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only re-extract years whose workbooks or transform code changed; reuse stored results for the rest")
+    parser.add_argument("--timing", metavar="PATH",
+                        help="Write a JSON report of time spent per stage (discover, parse, header, extract, ...) to PATH")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="Profile the main process and write the dump to PATH (pool workers are not included)")
+    parser.add_argument("--profiler", choices=["cprofile", "pyinstrument"], default="cprofile",
+                        help="Profiler for --profile (default: cprofile; pyinstrument must be installed)")
+    return parser
+
+def imap_years(fn, years, workers=1):
+    """
+    Run fn(year) for every year and yield the results one year at a time, in year order, so
+    callers can write each year out instead of holding every year.
+    Years are independent, so with workers > 1 they are fanned out to a process pool;
+    pool.map keeps input order, so the merged output is identical to the serial run.
+    fn must be a module-level function so it can be pickled.
+    """
+    years = list(years)
+    if workers <= 1:
+        for year in years:
+            with span("year", year):
+                res = fn(year)
+            yield res
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Each worker returns its spans with the result, so --timing covers the whole pool
+        for res, spans in pool.map(partial(timed_call, fn), years):
+            merge(spans)
+            yield res
+
+def year_input_hash(base_dir, year):
+    """Hash of every workbook (name + content) in one year directory."""
+    h = hashlib.sha256()
+    year_dir = os.path.join(base_dir, str(year))
+    if os.path.exists(year_dir):
+        for filename in sorted(os.listdir(year_dir)):
+            if filename.startswith("~") or not (filename.endswith(".xls") or filename.endswith(".xlsx")):
+                continue
+            h.update(filename.encode("utf-8"))
+            h.update(file_sha256(os.path.join(year_dir, filename)).encode("ascii"))
+    return h.hexdigest()
+
+def code_hash(fn):
     """
-    best_row = None
-    max_matches = 0
-    threshold = 2
-    
-    for i, row in df.head(max_scan).iterrows():
-        # Use cleaned values for robust matching
-        cleaned_vals = [clean_str(x) for x in row.values]
-        row_clean = "".join(cleaned_vals)
-        
-        matches = sum(1 for k in keywords if k in row_clean)
-        
-        # Strictly greater to prefer earlier rows in case of ties?
-        # Or >= to prefer later? Usually header is lower down if duplicate.
-        # But here Row 3 vs Row 4. We want Row 4 (5 matches) over Row 3 (4 matches).
-        if matches >= threshold and matches >= max_matches:
-            max_matches = matches
-            best_row = i
-            
-    return best_row
+    Hash of the script defining fn plus the shared ETL modules and rule files, so a rule
+    change (e.g. a new "match" keyword in category_map.json) dirties every year.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    paths = [sys.modules[fn.__module__].__file__] + [os.path.join(here, name) for name in SHARED_MODULES]
+    h = hashlib.sha256()
+    for path in paths:
+        h.update(file_sha256(path).encode("ascii"))
+    for path in SHARED_DATA:
+        h.update(path.encode("utf-8"))
+        h.update(file_sha256(path).encode("ascii") if os.path.exists(path) else b"missing")
+    return h.hexdigest()
+
+def imap_years_incremental(fn, years, base_dir, workers=1):
+    """
+    imap_years that only re-runs fn for dirty years.
+    A year is clean when its workbook hash and the code hash match the manifest of the previous run;
+    its stored result is reused and spliced back in year order.
+    """
+    years = list(years)
+    script = os.path.splitext(os.path.basename(sys.modules[fn.__module__].__file__))[0]
+    state_dir = os.path.join(INCREMENTAL_DIR, script)
+    manifest_path = os.path.join(state_dir, "manifest.json")
+
+    manifest = {"code_hash": None, "years": {}}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+
+    current_code = code_hash(fn)
+    if manifest["code_hash"] != current_code:
+        manifest = {"code_hash": current_code, "years": {}}
+
+    input_hashes = {year: year_input_hash(base_dir, year) for year in years}
+    dirty = [year for year in years
+             if manifest["years"].get(str(year)) != input_hashes[year]
+             or not os.path.exists(os.path.join(state_dir, f"{year}.pkl"))]
+    print(f"Incremental: {len(dirty)} of {len(years)} years to rebuild {dirty}")
+
+    os.makedirs(state_dir, exist_ok=True)
+    for year, res in zip(dirty, imap_years(fn, dirty, workers)):
+        with open(os.path.join(state_dir, f"{year}.pkl"), 'wb') as f:
+            pickle.dump(res, f, protocol=pickle.HIGHEST_PROTOCOL)
+        manifest["years"][str(year)] = input_hashes[year]
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    for year in years:
+        with open(os.path.join(state_dir, f"{year}.pkl"), 'rb') as f:
+            yield pickle.load(f)
+
+def iter_years(fn, years, args, base_dir):
+    """Yield per-year results via imap_years or imap_years_incremental, depending on --incremental."""
+    if args.incremental:
+        return imap_years_incremental(fn, years, base_dir, args.workers)
+    return imap_years(fn, years, args.workers)
 
+def run_years(fn, years, args, base_dir):
+    """iter_years collected into a list."""
+    return list(iter_years(fn, years, args, base_dir))
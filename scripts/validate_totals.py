@@ -0,0 +1,193 @@
+"""
+Reconciliation checks over the transform outputs, run after every build:
+
+    children    each node's amount vs the sum of its children (Xiang -> Kuan, Mu -> Xiang, Jie -> Mu)
+    orphan      nodes below Kuan whose parent_id is missing or not a node of the level above
+    year_total  each year's amount (the sum of its Kuan) vs the sheet's own 合計 (sheet_total)
+    cross_file  year totals of revenue_by_source / expenditure_by_function / expenditure_by_agency and
+                the cross-tabs vs summary.json's revenue / expenditure
+
+All checks are group-by sums over one flat frame of every node, so the whole run takes
+a couple of seconds. Every discrepancy is written with its delta (actual - expected) to
+data/unified/validation_report.csv and, with per-check counts, validation_report.json.
+The exit status is 1 when any check fails, so a parser change that breaks a parent/child
+sum fails the build like a double-counted or truncated year does.
+
+    python scripts/validate_totals.py
+"""
+
+import os
+import sys
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from transform_crosstab import CrossTab
+
+JSON_DIR = "data/json"
+UNIFIED_DIR = "data/unified"
+REPORT_CSV = os.path.join(UNIFIED_DIR, "validation_report.csv")
+REPORT_JSON = os.path.join(UNIFIED_DIR, "validation_report.json")
+LEVEL_TABLES = {
+    "revenue": ("revenue_by_source.json", "revenue"),
+    "function": ("expenditure_by_function.json", "expenditure"),
+    "agency": ("expenditure_by_agency.json", "expenditure"),
+}
+CROSSTABS = {
+    "crosstab_agency_function": ("crosstab_agency_function.npz", "expenditure"),
+    "crosstab_agency_source": ("crosstab_agency_source.npz", "revenue"),
+}
+LEVELS = ["Kuan", "Xiang", "Mu", "Jie"]
+# Checks that fail the run
+BLOCKING = {"children", "orphan", "year_total", "cross_file"}
+REPORT_COLUMNS = ["check", "table", "year", "level", "id", "name", "expected", "actual", "delta"]
+
+
+def load_json(path):
+    if not os.path.exists(path):
+        print(f"Skipping {path} (not found)")
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def node_frame(table, years):
+    """Every node of one level table as rows: table, year, level, depth, id, name, amount, parent_id."""
+    frames = []
+    for year_data in years:
+        for depth, level in enumerate(LEVELS):
+            nodes = year_data.get(level, [])
+            if nodes:
+                frames.append(pd.DataFrame(nodes, columns=["id", "name", "amount", "parent_id"])
+                              .assign(table=table, year=year_data["year"], level=level, depth=depth))
+    return pd.concat(frames, ignore_index=True) if frames else None
+
+def check_children(nodes):
+    """
+    (children, orphan) discrepancy frames. A parent is only checked when it has children,
+    since leaves at any level carry their own amounts.
+    """
+    parents = nodes[["table", "year", "depth", "level", "id", "name", "amount"]]
+    children = nodes[nodes["depth"] > 0].assign(depth=lambda d: d["depth"] - 1)
+    # dropna=False: a child with no parent_id at all is an orphan too, not a row to skip
+    sums = (children.groupby(["table", "year", "depth", "parent_id"], sort=False, dropna=False)["amount"].sum()
+            .rename("actual").reset_index().rename(columns={"parent_id": "id"}))
+    merged = sums.merge(parents, on=["table", "year", "depth", "id"], how="left", indicator=True)
+
+    matched = merged[merged["_merge"] == "both"]
+    bad = matched[matched["actual"] != matched["amount"]]
+    children_report = bad.assign(check="children", expected=bad["amount"])
+
+    # Orphans: children whose parent id is null or not on the level above (reported per parent_id)
+    lost = merged[merged["_merge"] == "left_only"]
+    orphan_report = lost.assign(check="orphan", level=lost["depth"].map(lambda d: LEVELS[d]),
+                                name=None, expected=0)
+    checked = len(matched) + len(lost)
+    report = pd.concat([children_report, orphan_report], ignore_index=True)
+    report["delta"] = report["actual"] - report["expected"]
+    return report, checked
+
+def year_totals(table, years):
+    """Per year: the stored amount and the sheet's 合計 (NaN if absent)."""
+    return pd.DataFrame([{
+        "table": table, "year": y["year"], "amount": y["amount"],
+        "sheet_total": y.get("sheet_total"),
+    } for y in years])
+
+def check_year_totals(totals):
+    """
+    year_total discrepancies: amount vs sheet_total where the sheet has one. The amount is the
+    sum of the Kuan by construction, so the sheet's own 合計 is the only independent figure.
+    """
+    known = totals[totals["sheet_total"].notna()]
+    bad = known[known["amount"] != known["sheet_total"]]
+    report = bad.assign(check="year_total", level="Total", id=None, name="sheet 合計",
+                        expected=bad["sheet_total"].astype(np.int64), actual=bad["amount"])
+    report["delta"] = report["actual"] - report["expected"]
+    return report, len(known)
+
+def check_cross_file(totals, summary):
+    """cross_file discrepancies: each table's year amount vs summary.json's revenue / expenditure."""
+    expected = pd.DataFrame([{"year": y["year"], "revenue": y["revenue"], "expenditure": y["expenditure"]}
+                             for y in summary]).melt(id_vars="year", var_name="kind", value_name="expected")
+    merged = totals.merge(expected, on=["year", "kind"], how="inner")
+    # summary.json leaves a total at 0 when its sheet has no 合計 row; nothing to compare against
+    merged = merged[merged["expected"] != 0]
+    bad = merged[merged["amount"] != merged["expected"]]
+    report = bad.assign(check="cross_file", level="Total", id=None, name="summary.json " + bad["kind"],
+                        actual=bad["amount"])
+    report["delta"] = report["actual"] - report["expected"]
+    return report, len(merged)
+
+def main():
+    parser = argparse.ArgumentParser(description="Check parent/child sums and cross-file totals of the transform outputs")
+    parser.add_argument("--json-dir", default=JSON_DIR, help=f"Transform outputs directory (default: {JSON_DIR})")
+    parser.add_argument("--unified-dir", default=UNIFIED_DIR, help=f"Cross-tab directory (default: {UNIFIED_DIR})")
+    args = parser.parse_args()
+
+    reports = []
+    checked = {}
+    node_frames, total_frames = [], []
+    for table, (filename, kind) in LEVEL_TABLES.items():
+        years = load_json(os.path.join(args.json_dir, filename))
+        if not years:
+            continue
+        frame = node_frame(table, years)
+        if frame is not None:
+            node_frames.append(frame)
+        total_frames.append(year_totals(table, years).assign(kind=kind))
+    for table, (filename, kind) in CROSSTABS.items():
+        path = os.path.join(args.unified_dir, filename)
+        if not os.path.exists(path):
+            print(f"Skipping {path} (not found)")
+            continue
+        tab = CrossTab.load(path)
+        amounts = pd.Series(tab.amount).groupby(tab.years).sum()
+        total_frames.append(pd.DataFrame({"table": table, "year": amounts.index, "amount": amounts.values,
+                                          "sheet_total": np.nan, "kind": kind}))
+    if not node_frames and not total_frames:
+        print("No transform outputs found; run the transform_*.py scripts first.")
+        return 1
+
+    if node_frames:
+        report, n = check_children(pd.concat(node_frames, ignore_index=True))
+        reports.append(report)
+        checked["children"] = n
+    totals = pd.concat(total_frames, ignore_index=True)
+    report, checked["year_total"] = check_year_totals(totals)
+    reports.append(report)
+    summary = load_json(os.path.join(args.json_dir, "summary.json"))
+    if summary:
+        report, checked["cross_file"] = check_cross_file(totals, summary)
+        reports.append(report)
+
+    report = pd.concat(reports, ignore_index=True)[REPORT_COLUMNS]
+    report = report.sort_values(["check", "table", "year", "level", "id"], kind="stable").reset_index(drop=True)
+    for col in ["expected", "actual", "delta"]:
+        report[col] = report[col].astype(np.int64)
+    failed = report["check"].value_counts().to_dict()
+    checks = {name: {"checked": n, "failed": int(failed.get(name, 0))} for name, n in checked.items()}
+    if "children" in checks:
+        checks["orphan"] = {"checked": checked["children"], "failed": int(failed.get("orphan", 0))}
+    ok = not any(checks[name]["failed"] for name in checks if name in BLOCKING)
+
+    os.makedirs(os.path.dirname(REPORT_CSV), exist_ok=True)
+    report.to_csv(REPORT_CSV, index=False)
+    with open(REPORT_JSON, 'w', encoding='utf-8') as f:
+        json.dump({"ok": ok, "checks": checks, "discrepancies": json.loads(report.to_json(orient="records", force_ascii=False))},
+                  f, ensure_ascii=False, indent=2)
+
+    for name, stats in checks.items():
+        print(f"  {name:<11} {stats['failed']:6d} of {stats['checked']:6d} failed")
+    by_table = report.groupby(["check", "table"]).size()
+    for (check, table), n in by_table.items():
+        print(f"  {check}/{table}: {n} discrepanc{'y' if n == 1 else 'ies'}, "
+              f"years {', '.join(map(str, sorted(report[(report['check'] == check) & (report['table'] == table)]['year'].unique())))}")
+    print(f"Wrote {REPORT_CSV} and {REPORT_JSON} ({len(report)} discrepancies).")
+    if not ok:
+        print(f"Validation FAILED: {', '.join(n for n in checks if n in BLOCKING and checks[n]['failed'])}")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
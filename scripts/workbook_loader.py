@@ -0,0 +1,167 @@
+import hashlib
+import os
+import pandas as pd
+
+from timing import timed
+
+# On-disk cache of parsed sheets. The DGBAS files never change after publication,
+# so a sheet is keyed by file content hash and only re-decoded when the file or parser changes.
+CACHE_DIR = os.path.join(".cache", "workbooks")
+# Bump when the way sheets are read changes, so stale grids are not reused
+PARSER_VERSION = 1
+CACHE_MAX_BYTES = int(os.environ.get("WORKBOOK_CACHE_MAX_MB", "1024")) * 1024 * 1024
+# Rows read to classify a workbook and find its header
+PROBE_ROWS = 20
+
+
+def set_cache_enabled(enabled):
+    """Turn the on-disk cache on/off (--no-cache). Kept in the environment so pool workers inherit it."""
+    os.environ["WORKBOOK_CACHE"] = "1" if enabled else "0"
+
+def cache_enabled():
+    return os.environ.get("WORKBOOK_CACHE", "1") != "0"
+
+def file_sha256(filepath):
+    h = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _cache_path(digest, sheet_name, nrows=None):
+    rows = f"-n{nrows}" if nrows is not None else ""
+    key = f"{digest}-s{sheet_name}{rows}-v{PARSER_VERSION}-pd{pd.__version__}"
+    return os.path.join(CACHE_DIR, key + ".pkl")
+
+def _evict(max_bytes=CACHE_MAX_BYTES):
+    """Drop least recently used grids (by mtime, refreshed on every hit) until the cache fits max_bytes."""
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        path = os.path.join(CACHE_DIR, name)
+        st = os.stat(path)
+        entries.append((st.st_mtime, st.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except FileNotFoundError:
+            pass # Another worker evicted it first
+
+def _load_cached(path, parse):
+    """The grid pickled at path, or parse() stored there for next time."""
+    if os.path.exists(path):
+        try:
+            df = pd.read_pickle(path)
+            os.utime(path)
+            return df
+        except Exception as e:
+            print(f"  Warning: discarding unreadable cache entry {path}: {e}")
+
+    df = parse()
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Write then rename so parallel workers never read a half-written entry
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        df.to_pickle(tmp_path)
+        os.replace(tmp_path, path)
+        _evict()
+    except OSError as e:
+        print(f"  Warning: could not write workbook cache {path}: {e}")
+    return df
+
+def open_workbook(filepath):
+    """
+    Lazy handle on a workbook: .xlsx is opened by openpyxl in read-only (streaming) mode and .xls by
+    xlrd, and no sheet is converted to a DataFrame until it is parsed.
+    """
+    return pd.ExcelFile(filepath)
+
+@timed("workbook.read")
+def read_workbook(filepath, sheet_name=0, open_book=open_workbook):
+    """
+    pd.read_excel(filepath, sheet_name=sheet_name, header=None), served from the on-disk cache when possible.
+    The grid is pickled rather than stored as Parquet because the raw cells mix text and numbers in one column.
+    open_book(filepath) supplies the handle on a cache miss; WorkbookCache passes one that reuses
+    the handle of an earlier probe.
+    """
+    parse = lambda: open_book(filepath).parse(sheet_name, header=None)
+    if not cache_enabled():
+        return parse()
+    return _load_cached(_cache_path(file_sha256(filepath), sheet_name), parse)
+
+@timed("workbook.probe")
+def probe_workbook(filepath, sheet_name=0, nrows=PROBE_ROWS, open_book=open_workbook):
+    """
+    The top `nrows` rows of a sheet (the values of read_workbook(...).head(nrows)), for classifying a
+    workbook before deciding to parse it. parse(nrows=) stops the openpyxl row stream early on .xlsx
+    and only converts the first rows on .xls, so a probe costs a fraction of a full read.
+    A fully cached grid is reused; otherwise the probe is cached on its own.
+    """
+    parse = lambda: open_book(filepath).parse(sheet_name, header=None, nrows=nrows)
+    if not cache_enabled():
+        return parse()
+    digest = file_sha256(filepath)
+    full_path = _cache_path(digest, sheet_name)
+    if os.path.exists(full_path):
+        return read_workbook(filepath, sheet_name, open_book).head(nrows)
+    return _load_cached(_cache_path(digest, sheet_name, nrows), parse)
+
+
+class WorkbookCache:
+    """
+    Parses each workbook once and hands the same in-memory grid to every caller
+    (header scan, row extraction). Classification only needs probe(), so a workbook
+    nobody consumes is never fully parsed.
+    `parse_count` / `parse_counts` record how many times each file was loaded in full,
+    so a run can assert exactly one load per file; `probe_count` counts header probes.
+    """
+
+    def __init__(self):
+        self._frames = {}
+        # Handles opened by probe(), reused by read() so a probed file is opened only once
+        self._books = {}
+        self.parse_count = 0
+        self.parse_counts = {}
+        self.probe_count = 0
+
+    def _book(self, filepath):
+        """Open handle for filepath; a cache hit never opens the file at all."""
+        key = os.path.abspath(filepath)
+        if key not in self._books:
+            self._books[key] = open_workbook(filepath)
+        return self._books[key]
+
+    def probe(self, filepath):
+        """The top PROBE_ROWS rows of filepath (from the full grid if already loaded), or None if unreadable."""
+        key = os.path.abspath(filepath)
+        if self._frames.get(key) is not None:
+            return self._frames[key].head(PROBE_ROWS)
+        self.probe_count += 1
+        try:
+            return probe_workbook(filepath, open_book=self._book)
+        except Exception as e:
+            print(f"Error reading file {filepath}: {e}")
+            return None
+
+    def read(self, filepath):
+        """Return the full sheet (header=None) for filepath, or None if unreadable."""
+        key = os.path.abspath(filepath)
+        if key not in self._frames:
+            self.parse_count += 1
+            self.parse_counts[key] = self.parse_counts.get(key, 0) + 1
+            try:
+                self._frames[key] = read_workbook(filepath, open_book=self._book)
+            except Exception as e:
+                print(f"Error reading file {filepath}: {e}")
+                self._frames[key] = None
+        return self._frames[key]
+
+    def release(self, filepath):
+        """Drop a parsed grid once its file is done, so a full run does not hold every year in memory."""
+        self._frames.pop(os.path.abspath(filepath), None)
+        book = self._books.pop(os.path.abspath(filepath), None)
+        if book is not None:
+            book.close()